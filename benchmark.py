@@ -0,0 +1,193 @@
+'''
+Times the hot stages of a run across population sizes and reports time and
+peak memory per stage. Run as a module and keep the JSON around to compare
+versions:
+
+    python -m benchmark --sizes 10000 1000000 --json before.json
+    python -m benchmark --sizes 10000 1000000 --json after.json --compare before.json
+'''
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+from DSEIR import DSEIR
+from main import get_parser
+from population import INFECTED
+from simulation import Simulation
+
+
+def measure(function, repeat = 1, setup = None):
+    '''
+    Time function untraced, then run it once more under tracemalloc for its peak
+    memory, since tracing slows Python-heavy code several times over
+
+    args:
+        setup: called before each pass to restore the state function starts from, if given
+    returns:
+        seconds per call and peak bytes allocated by a single call
+    '''
+    if setup is not None:
+        setup()
+    start = time.perf_counter()
+    for i in range(repeat):
+        function()
+    seconds = (time.perf_counter() - start) / repeat
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def day_loop(simulation, days, start_day = 0, traced = False):
+    '''
+    Run the day loop split into its random walk and transitions
+
+    args:
+        start_day: days simulated first, e.g. to reach the epidemic peak where transitions are most expensive
+        traced: trace memory instead of timing, as tracing slows the stages down
+    returns:
+        mean seconds per day and peak bytes of a day, per stage, the ones not measured are 0
+    '''
+    for day in range(start_day):
+        simulation.step()
+
+    seconds, peaks = {'step': [], 'update': []}, {'step': [0], 'update': [0]}
+    for day in range(days):
+        for stage, function in (('step', simulation.population.take_step), ('update', simulation.update)):
+            if stage == 'update':
+                simulation.susceptible_index = None
+                simulation.day += 1
+            if traced:
+                tracemalloc.start()
+                function()
+                peaks[stage].append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            else:
+                start = time.perf_counter()
+                function()
+                seconds[stage].append(time.perf_counter() - start)
+    return ({stage: float(np.mean(values)) if values else 0.0 for stage, values in seconds.items()},
+            {stage: max(values) for stage, values in peaks.items()})
+
+
+def peak_window(simulation, days):
+    '''First day of the `days` long window centred on the DSEIR infection peak, kept inside the solved curve'''
+    infected = simulation.DSEIR_values[2]
+    return int(min(max(np.argmax(infected) - days // 2, 0), max(len(infected) - 1 - days, 0)))
+
+
+def benchmark_size(args, number_people, days, queries, start_day = None):
+    '''Time every stage for one population size
+
+    args:
+        start_day: days simulated before timing step and update, the window around the infection peak if None
+    returns:
+        list of {'people', 'stage', 'seconds', 'peak_memory_bytes'} results
+    '''
+    args = argparse.Namespace(**vars(args))
+    args.TP = number_people
+
+    stages = {}
+    stages['DSEIR.runAll'] = measure(lambda: DSEIR(args))
+    # load_people draws from the generator, so it runs on a simulation of its own
+    scratch = Simulation(args, headless = True, seed = args.seed)
+    stages['load_people'] = measure(lambda: scratch.load_people(number_people = args.TP,
+                                                                number_infected = args.I,
+                                                                number_exposed = args.E))
+    del scratch
+
+    # the day loop changes the simulation, so it is timed untraced and then replayed under
+    # tracemalloc on a second simulation with the same seed, which takes the same days
+    simulation = Simulation(args, headless = True, seed = args.seed)
+    if start_day is None:
+        start_day = peak_window(simulation, days)
+    print('{} people: timing days {} to {}'.format(number_people, start_day + 1, start_day + days))
+    seconds, _ = day_loop(simulation, days, start_day, traced = False)
+    _, peaks = day_loop(Simulation(args, headless = True, seed = args.seed), days, start_day, traced = True)
+    for stage in ('step', 'update'):
+        stages[stage] = (seconds[stage], peaks[stage])
+
+    # index build once per day, then per query from random infected (or anyone) people
+    def reset_index():
+        simulation.susceptible_index = None
+    stages['susceptible_index'] = measure(simulation.get_susceptible_index, setup = reset_index)
+    sources = simulation.population.members(INFECTED)
+    if len(sources) == 0:
+        sources = np.arange(len(simulation.population))
+    # one more point for the traced pass
+    points = iter(simulation.rng.choice(sources, queries + 1))
+    stages['find_closest_person'] = measure(lambda: simulation.find_closest_person(next(points), type = 'SUSCEPTIBLE'), repeat = queries)
+
+    return [{'people': number_people, 'stage': stage, 'seconds': float(seconds), 'peak_memory_bytes': int(peak)}
+            for stage, (seconds, peak) in stages.items()]
+
+
+def version():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results, baseline = None):
+    '''Print a table of results, with the speedup over a baseline run if given'''
+    previous = {}
+    if baseline is not None:
+        previous = {(result['people'], result['stage']): result['seconds'] for result in baseline['results']}
+
+    print('{:>10} {:<20} {:>12} {:>12} {:>10}'.format('people', 'stage', 'seconds', 'peak MB', 'speedup' if previous else ''))
+    for result in results:
+        old = previous.get((result['people'], result['stage']))
+        speedup = '{:.2f}x'.format(old / result['seconds']) if old and result['seconds'] else ''
+        print('{:>10} {:<20} {:>12.6f} {:>12.1f} {:>10}'.format(result['people'], result['stage'], result['seconds'],
+                                                             result['peak_memory_bytes'] / 2 ** 20, speedup))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'time population build, daily step and ODE solve across population sizes')
+    parser.add_argument('--sizes', help = 'population sizes to benchmark', type = int, nargs = '+', default = [10000, 100000, 1000000])
+    parser.add_argument('--days', help = 'number of simulated days timed for the step and update stages', type = int, default = 20)
+    parser.add_argument('--start-day', help = 'simulate this many days untimed before timing step and update, '
+                        'by default up to the window around the DSEIR infection peak', type = int, default = None)
+    parser.add_argument('--TD', help = 'length of the DSEIR solve in days', type = int, default = 160)
+    parser.add_argument('--queries', help = 'number of find_closest_person calls timed', type = int, default = 100)
+    parser.add_argument('--integrator', help = 'ODE backend used by DSEIR', choices = ('odeint', 'rk4', 'discrete'), default = 'odeint')
+    parser.add_argument('--seed', help = 'seed for the simulation', type = int, default = 0)
+    parser.add_argument('--json', help = 'save results to this file', default = None)
+    parser.add_argument('--compare', help = 'results file of an earlier run to compare against', default = None)
+    options = parser.parse_args()
+
+    # every other parameter keeps the main.py default
+    args = get_parser().parse_args([])
+    args.TD, args.integrator, args.seed = options.TD, options.integrator, options.seed
+
+    results = []
+    for number_people in options.sizes:
+        results.extend(benchmark_size(args, number_people, options.days, options.queries, options.start_day))
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as file:
+            baseline = json.load(file)
+    report(results, baseline)
+
+    if options.json:
+        with open(options.json, 'w') as file:
+            json.dump({'version': version(),
+                       'python': platform.python_version(),
+                       'numpy': np.__version__,
+                       'options': vars(options),
+                       'results': results}, file, indent = 2)
+
+
+if __name__ == '__main__':
+    main()
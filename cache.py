@@ -0,0 +1,152 @@
+'''
+Memoizing cache in front of DSEIR.runAll. Results are keyed on every parameter
+of the solve and kept in an in-process LRU, optionally backed by a directory
+of content-addressed .npz files whose total size is bounded by evicting the
+least recently used ones. DSEIR (and with it scipy) is only imported on a miss.
+'''
+
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+from schedule import freeze
+
+# args that change the DSEIR solution, with their defaults when missing from args
+PARAMETERS = (('E', 0), ('I', 0), ('R', 0), ('D', 0), ('TD', 160), ('TP', 10000),
+              ('sig', .143), ('gam', .095), ('mu', .005), ('prob', .1), ('numb', 10),
+              ('integrator', 'odeint'))
+
+
+def cache_key(args):
+    # the schedule is keyed on its contents, so editing a schedule file is never served a stale solution
+    return (tuple((name, getattr(args, name, default)) for name, default in PARAMETERS)
+            + (('schedule', freeze(getattr(args, 'schedule', None))),))
+
+
+class DSEIRCache():
+
+    def __init__(self, maxsize = 128, directory = None, max_bytes = 256 * 2 ** 20):
+        '''
+        args:
+            maxsize: number of solutions kept in memory
+            directory: where solutions are stored on disk, memory only if None
+            max_bytes: total size the directory is trimmed to after each write
+        '''
+        self.maxsize = maxsize
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.hits, self.misses = 0, 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok = True)
+
+    def get(self, args):
+        '''
+        returns:
+            read-only (5, TD + 1) array of S, E, I, R, D values per day, as DSEIR(args).getDSEIR()
+        '''
+        values = self.lookup(args)
+        if values is None:
+            from DSEIR import DSEIR
+
+            values = self.put(args, np.array(DSEIR(args).getDSEIR()))
+        return values
+
+    def lookup(self, args):
+        '''
+        returns:
+            the cached solution for args from memory or disk, None on a miss
+        '''
+        key = cache_key(args)
+        if key in self.memory:
+            self.hits += 1
+            self.memory.move_to_end(key)
+            return self.memory[key]
+
+        values = self.load(key)
+        if values is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.remember(key, values)
+        return values
+
+    def put(self, args, values):
+        '''Cache a solution solved elsewhere (e.g. in a batched sweep), returns it read-only'''
+        key = cache_key(args)
+        self.store(key, values)
+        return self.remember(key, values)
+
+    def remember(self, key, values):
+        values.flags.writeable = False
+        self.memory[key] = values
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last = False)
+        return values
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest() + '.npz')
+
+    def load(self, key):
+        if self.directory is None or not os.path.exists(self.path(key)):
+            return None
+        try:
+            with np.load(self.path(key)) as archive:
+                if str(archive['key']) != repr(key):
+                    return None
+                values = archive['values']
+        except (OSError, ValueError, KeyError):
+            # another process may be replacing or evicting the file
+            return None
+        # touch it so eviction treats it as recently used
+        os.utime(self.path(key))
+        return values
+
+    def store(self, key, values):
+        if self.directory is None:
+            return
+        path = self.path(key)
+        temporary = '{}.{}.tmp.npz'.format(path[:-len('.npz')], os.getpid())
+        np.savez(temporary, key = repr(key), values = values)
+        os.replace(temporary, path)
+        self.evict()
+
+    def evict(self):
+        '''Remove the least recently used files until the directory fits in max_bytes'''
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+
+caches = {}
+
+
+def solve(args):
+    '''
+    DSEIR solution for args through the cache selected by args.cache_dir and
+    args.cache_size (in MB), memory only when they are missing.
+
+    returns:
+        read-only (5, TD + 1) array of S, E, I, R, D values per day
+    '''
+    directory = getattr(args, 'cache_dir', None)
+    if directory not in caches:
+        caches[directory] = DSEIRCache(directory = directory, max_bytes = getattr(args, 'cache_size', 256) * 2 ** 20)
+    return caches[directory].get(args)
@@ -0,0 +1,82 @@
+'''
+Checkpoints of a running Simulation. A checkpoint is a directory of plain .npy
+arrays (coordinates, compartment state, compartment pools and the cached DSEIR
+curve) plus a small meta.json with the day, the run's args and the generator
+state, so a resumed run continues bit-identically. The arrays are opened
+memory-mapped copy-on-write, so many what-if runs forked from one snapshot
+share its pages until they change them.
+'''
+
+import json
+import os
+import shutil
+
+import numpy as np
+from population import COMPARTMENTS, Population
+
+VERSION = 1
+
+
+def save_checkpoint(simulation, path, args = None):
+    '''Write the full state of a simulation to the directory `path`
+
+    The checkpoint is written next to `path` first and then swapped in, so a run
+    killed mid-write still leaves the previous checkpoint intact.
+
+    args:
+        simulation: Simulation to save
+        path: checkpoint directory, replaced if it exists
+        args: the run's parsed command line args, stored for reference
+    '''
+    temporary = path.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(temporary, ignore_errors = True)
+    os.makedirs(temporary)
+
+    population = simulation.population
+    np.save(os.path.join(temporary, 'coordinates.npy'), population.coordinates)
+    np.save(os.path.join(temporary, 'state.npy'), population.state)
+    # pool order decides which people get sampled, so it is saved as is
+    for compartment, name in enumerate(COMPARTMENTS):
+        np.save(os.path.join(temporary, 'pool_{}.npy'.format(name.lower())), population.members(compartment))
+    np.save(os.path.join(temporary, 'DSEIR_values.npy'), np.array(simulation.DSEIR_values[:5], dtype = np.float64))
+
+    meta = {'version': VERSION,
+            'day': simulation.day,
+            'rng': simulation.rng.bit_generator.state,
+            # tile streams and strips of parallel runs, see parallel.py
+            'parallel': simulation.stepper.settings() if getattr(simulation, 'stepper', None) is not None else None,
+            'args': vars(args) if args is not None else None}
+    with open(os.path.join(temporary, 'meta.json'), 'w') as file:
+        json.dump(meta, file, default = str)
+
+    if os.path.exists(path):
+        previous = path.rstrip(os.sep) + '.old'
+        shutil.rmtree(previous, ignore_errors = True)
+        os.rename(path, previous)
+        os.rename(temporary, path)
+        shutil.rmtree(previous)
+    else:
+        os.rename(temporary, path)
+
+
+def load_checkpoint(path, rng):
+    '''Read a checkpoint written by save_checkpoint
+
+    args:
+        path: checkpoint directory
+        rng: np.random.Generator of the resumed simulation, the population draws from it
+    returns:
+        meta dict (day, rng state, args), the Population and the DSEIR curve as a list of S E I R D lists
+    '''
+    with open(os.path.join(path, 'meta.json')) as file:
+        meta = json.load(file)
+    if meta['version'] != VERSION:
+        raise ValueError('checkpoint {} has version {}, expected {}'.format(path, meta['version'], VERSION))
+
+    population = Population(np.load(os.path.join(path, 'coordinates.npy'), mmap_mode = 'c'),
+                            np.load(os.path.join(path, 'state.npy'), mmap_mode = 'c'),
+                            rng = rng,
+                            pools = [np.load(os.path.join(path, 'pool_{}.npy'.format(name.lower())))
+                                     for name in COMPARTMENTS])
+    DSEIR_values = [list(values) for values in np.load(os.path.join(path, 'DSEIR_values.npy'))]
+    return meta, population, DSEIR_values
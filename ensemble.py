@@ -0,0 +1,61 @@
+'''
+Runs replicates of the stochastic agent simulation across a process pool and
+aggregates their per-day compartment counts into mean and quantile bands.
+'''
+
+import multiprocessing
+
+import numpy as np
+from simulation import Simulation
+
+
+def run_replicate(job):
+    '''Run one headless simulation, called in a worker process
+
+    args:
+        job: tuple of the parsed command line args and the replicate's np.random.SeedSequence
+    returns:
+        (TD + 1, 5) array of compartment counts per day
+    '''
+    args, seed = job
+    simulation = Simulation(args, headless = True, seed = seed)
+    counts, _ = simulation.run_headless(number_days = args.TD)
+    return counts
+
+
+def summarize(counts, quantiles = (0.05, 0.5, 0.95)):
+    '''
+    args:
+        counts: (replicates, days + 1, 5) array of compartment counts
+        quantiles: quantiles of the bands to compute
+    returns:
+        (days + 1, 5) mean counts and (len(quantiles), days + 1, 5) quantile bands
+    '''
+    return counts.mean(axis = 0), np.quantile(counts, quantiles, axis = 0)
+
+
+def run_ensemble(args, replicates, processes = None, seed = None, quantiles = (0.05, 0.5, 0.95)):
+    '''Run replicates of a headless Simulation in parallel
+
+    Each replicate gets an independent random stream spawned from one
+    SeedSequence, so the whole ensemble is reproducible from `seed` no matter
+    how many processes run it.
+
+    args:
+        args: parsed command line args shared by every replicate
+        replicates: number of simulations to run
+        processes: size of the process pool, defaults to the number of cores
+        seed: entropy for the root SeedSequence, None for a fresh one
+        quantiles: quantiles of the bands to compute
+    returns:
+        mean counts, quantile bands (see summarize) and the raw
+        (replicates, TD + 1, 5) counts of every replicate
+    '''
+    if (getattr(args, 'mode', None) or 'curve') == 'curve':
+        print('run_ensemble(): curve mode agents follow the DSEIR curve, every replicate gets the same counts; use mode contact')
+    seeds = np.random.SeedSequence(seed).spawn(replicates)
+    with multiprocessing.Pool(processes) as pool:
+        counts = np.stack(pool.map(run_replicate, [(args, replicate_seed) for replicate_seed in seeds]))
+
+    mean, bands = summarize(counts, quantiles)
+    return mean, bands, counts
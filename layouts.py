@@ -0,0 +1,78 @@
+'''
+Starting positions for a population of any size, built with one vectorized
+call each. Every layout covers about one unit of area per person, like the
+original square grid, so contact radii mean the same thing across layouts:
+
+    grid: one grid point per person, filled row by row on the smallest square that fits
+    uniform: independent uniform positions over that square
+    clustered: positions drawn from a 2-D density (weights per cell, e.g. a population
+               raster) with square cells scaled to the same total area, uniform within each cell
+'''
+
+import math
+import os
+
+import numpy as np
+
+LAYOUTS = ('grid', 'uniform', 'clustered')
+
+
+def side(number_people):
+    '''Length of the square one unit of area per person covers, rounded up like the grid'''
+    return max(math.ceil(math.sqrt(number_people)), 1)
+
+
+def grid(number_people, rng = None):
+    '''Grid points (1, 1), (1, 2), ... filled row by row, the original layout for perfect squares'''
+    rows, columns = np.divmod(np.arange(number_people), side(number_people))
+    return np.column_stack((rows + 1, columns + 1)).astype(np.float64)
+
+
+def uniform(number_people, rng):
+    return rng.uniform(0.5, side(number_people) + 0.5, size = (number_people, 2))
+
+
+def clustered(number_people, rng, density):
+    '''
+    args:
+        density: 2-D array of non-negative weights, people land in each cell in proportion to its weight
+    '''
+    density = np.asarray(density, dtype = np.float64)
+    if density.ndim != 2 or np.any(density < 0) or not density.sum() > 0:
+        raise ValueError('density must be a 2-D array of non-negative weights with a positive sum')
+
+    cell = math.sqrt(max(number_people, 1) / density.size)
+    cells = rng.choice(density.size, size = number_people, p = (density / density.sum()).ravel())
+    rows, columns = np.divmod(cells, density.shape[1])
+    return 0.5 + cell * (np.column_stack((rows, columns)) + rng.random((number_people, 2)))
+
+
+def load_density(path):
+    '''Read a density array from a .npy file or a comma or whitespace separated text file'''
+    if os.path.splitext(path)[1].lower() == '.npy':
+        return np.load(path)
+    return np.loadtxt(path, delimiter = ',' if path.lower().endswith('.csv') else None, ndmin = 2)
+
+
+def build_coordinates(number_people, layout = 'grid', rng = None, density = None):
+    '''
+    args:
+        number_people: number of positions, any size
+        layout: one of LAYOUTS
+        rng: np.random.Generator for the random layouts
+        density: array or file (see load_density) for the clustered layout
+    returns:
+        (number_people, 2) array of coordinates
+    '''
+    rng = rng if rng is not None else np.random.default_rng()
+    if layout == 'grid':
+        return grid(number_people)
+    if layout == 'uniform':
+        return uniform(number_people, rng)
+    if layout == 'clustered':
+        if density is None:
+            raise ValueError('the clustered layout needs a density array or file')
+        if isinstance(density, str):
+            density = load_density(density)
+        return clustered(number_people, rng, density)
+    raise ValueError('unknown layout {}, choose one of {}'.format(layout, LAYOUTS))
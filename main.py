@@ -5,15 +5,52 @@ Model allows for SEIRD epidemiological examination of COVID-19 kinetics.
 '''
 
 from simulation import Simulation
+from ensemble import run_ensemble
+from output import open_writer
+from profiling import Profiler
 import argparse
 
 def main(args):
-    simulation = Simulation(args)
-    simulation.run(number_days = args.TD)
+    if args.mode is None and (args.resume is None or args.replicates > 1):
+        # curve mode agents follow the deterministic DSEIR curve, so only contact replicates differ;
+        # a resumed run keeps the mode of its checkpoint
+        args.mode = 'contact' if args.replicates > 1 else 'curve'
+
+    if args.replicates > 1:
+        mean, bands, _ = run_ensemble(args, replicates = args.replicates, processes = args.processes, seed = args.seed)
+        print('Day {} over {} replicates (mean [5%, 95%]):'.format(args.TD, args.replicates))
+        for compartment, value, low, high in zip(('susceptible', 'exposed', 'infected', 'recovered', 'dead'),
+                                                 mean[-1], bands[0][-1], bands[-1][-1]):
+            print('    {}: {:.1f} [{:.0f}, {:.0f}]'.format(compartment, value, low, high))
+        return
+
+    writer = open_writer(args.output, snapshot_every = args.snapshot_every) if args.output else None
+    profiler = Profiler() if args.profile else None
+    checkpoints = dict(resume = args.resume, checkpoint = args.checkpoint, checkpoint_every = args.checkpoint_every)
+    simulation = None
+    try:
+        if args.headless:
+            simulation = Simulation(args, headless = True, seed = args.seed, writer = writer, profiler = profiler,
+                                    workers = args.workers, **checkpoints)
+            counts, _ = simulation.run_headless(number_days = max(args.TD - simulation.day, 0))
+            print('Day {}: susceptible {}, exposed {}, infected {}, recovered {}, dead {}'.format(simulation.day, *counts[-1]))
+            return
+
+        simulation = Simulation(args, seed = args.seed, writer = writer, profiler = profiler, workers = args.workers, **checkpoints)
+        simulation.run(number_days = args.TD - simulation.day, path = args.video, writer = args.writer,
+                       every = args.render_every, fps = args.fps)
+    finally:
+        if simulation is not None:
+            simulation.close()
+        if writer is not None:
+            writer.close()
+        if profiler is not None:
+            print(profiler.summary())
+            profiler.save(args.profile)
 
     args = parser.parse_args()
 
-if __name__ == "__main__":
+def get_parser():
     parser = argparse.ArgumentParser()
     
     parser.add_argument('--E', '--exposed', help = 'initial # people exposed', type = int, default =  1)
@@ -27,7 +64,36 @@ if __name__ == "__main__":
     parser.add_argument('--mu', '--mu', help = ' Death rate', type = int, default =  .005)
     parser.add_argument('--prob', '--prob_people', help = 'beta knot = probability of infection if meeting an infected person', type = int, default =  .1)
     parser.add_argument('--numb', '--numb_people', help = 'k = total number of people encountered', type = int, default =  10)
+    parser.add_argument('--workers', help = 'step contact mode days in this many processes over shared memory, see parallel.py', type = int, default = 1)
+    parser.add_argument('--layout', help = 'starting positions of the agents, see layouts.py', choices = ('grid', 'uniform', 'clustered'), default = 'grid')
+    parser.add_argument('--density', help = '.npy, .csv or text file of per-cell weights for the clustered layout', default = None)
+    parser.add_argument('--mode', help = 'curve: agents follow the DSEIR curve, contact: infection spreads between neighbouring agents. '
+                        'Defaults to contact with --replicates, curve otherwise', choices = ('curve', 'contact'), default = None)
+    parser.add_argument('--radius', help = 'contact mode: distance within which agents meet', type = float, default = 2)
+    parser.add_argument('--integrator', help = 'ODE backend: odeint (reference), rk4 (fixed step) or discrete (daily update)', choices = ('odeint', 'rk4', 'discrete'), default = 'odeint')
+    parser.add_argument('--video', help = 'file the animation is saved to, or a directory to dump PNG frames into', default = 'test.gif')
+    parser.add_argument('--writer', help = 'frame encoder, picked from the --video extension by default (pillow for .gif, ffmpeg for video)', choices = ('pillow', 'ffmpeg', 'imagemagick', 'frames'), default = None)
+    parser.add_argument('--render-every', help = 'draw one frame every this many days', type = int, default = 1)
+    parser.add_argument('--fps', help = 'frames per second of the saved animation', type = int, default = 5)
+    parser.add_argument('--schedule', help = 'JSON or CSV file of interventions changing beta, sigma, gamma or mu on given days, see schedule.py', default = None)
+    parser.add_argument('--cache-dir', help = 'directory DSEIR solutions are cached in across runs', default = None)
+    parser.add_argument('--cache-size', help = 'size in MB the cache directory is trimmed to', type = int, default = 256)
+    parser.add_argument('--profile', help = 'time every stage of a single run, print a summary and save the per-day trace to this JSON file',
+                        nargs = '?', const = 'profile.json', default = None)
+    parser.add_argument('--headless', help = 'run without plotting and print the final compartment counts', action = 'store_true')
+    parser.add_argument('--output', help = 'stream daily counts to this .csv, .parquet or .npz file', default = None)
+    parser.add_argument('--snapshot-every', help = 'with --output, also write every agent\'s position and state every this many days', type = int, default = 0)
+    parser.add_argument('--checkpoint', help = 'directory the full simulation state is saved to every --checkpoint-every days', default = None)
+    parser.add_argument('--checkpoint-every', help = 'days between checkpoints', type = int, default = 10)
+    parser.add_argument('--resume', help = 'continue from this checkpoint directory up to --TD; add --seed to fork a new random branch instead of continuing bit-identically', default = None)
+    parser.add_argument('--seed', help = 'seed for the random number generator, runs are reproducible given a seed', type = int, default = None)
+    parser.add_argument('--replicates', help = 'run this many headless replicates in parallel and print mean and 5-95% bands', type = int, default = 1)
+    parser.add_argument('--processes', help = 'number of worker processes for --replicates, defaults to the number of cores', type = int, default = None)
+
+    return parser
 
+if __name__ == "__main__":
+    parser = get_parser()
     args = parser.parse_args()
     main(args)
     
\ No newline at end of file
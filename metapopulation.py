@@ -0,0 +1,107 @@
+'''
+SEIRD over many regions at once, coupled by a sparse mobility matrix. Every
+region is a well-mixed DSEIR population, and people spend part of their time
+mixing in other regions: mobility[i, j] is the fraction of region i's residents
+that mix in region j, with whatever is left of each row mixing at home. The
+whole system is one (regions, 5) array integrated with DSEIR.integrate, so a
+step costs a few sparse products instead of one Python call per region.
+'''
+
+import numpy as np
+from DSEIR import integrate
+
+
+def as_coo(mobility, regions):
+    '''
+    Off-diagonal entries of a mobility matrix given as anything with .tocsr()
+    (scipy.sparse), a (data, indices, indptr) CSR tuple or a dense array.
+
+    returns:
+        rows, columns and weights arrays of the nonzero off-diagonal entries
+    '''
+    if hasattr(mobility, 'tocsr'):
+        mobility = mobility.tocsr()
+        mobility = (mobility.data, mobility.indices, mobility.indptr)
+    if isinstance(mobility, tuple):
+        data, indices, indptr = (np.asarray(array) for array in mobility)
+        if len(indptr) != regions + 1:
+            raise ValueError('mobility has {} rows, expected {}'.format(len(indptr) - 1, regions))
+        rows = np.repeat(np.arange(regions), np.diff(indptr))
+        columns, weights = indices.astype(np.int64), data.astype(np.float64)
+    else:
+        mobility = np.asarray(mobility, dtype = np.float64)
+        if mobility.shape != (regions, regions):
+            raise ValueError('mobility has shape {}, expected {}'.format(mobility.shape, (regions, regions)))
+        rows, columns = np.nonzero(mobility)
+        weights = mobility[rows, columns]
+
+    away = (rows != columns) & (weights != 0)
+    return rows[away], columns[away], weights[away]
+
+
+class Metapopulation():
+
+    def __init__(self, population, mobility, beta, sigma, gamma, mu, E = 0, I = 0, R = 0, D = 0):
+        '''
+        args:
+            population: total population of each region
+            mobility: (regions, regions) scipy.sparse matrix, (data, indices, indptr) CSR tuple or
+                      dense array, see the module docstring. The diagonal is ignored, each region
+                      keeps 1 - (sum of the rest of its row) at home
+            beta, sigma, gamma, mu: scalars or per region arrays, see DSEIR.sweep
+            E, I, R, D: initial number of exposed, infected, recovered and dead people per region
+        '''
+        self.population = np.atleast_1d(np.asarray(population, dtype = np.float64))
+        regions = len(self.population)
+        self.rows, self.columns, self.weights = as_coo(mobility, regions)
+        if np.any(self.weights < 0):
+            raise ValueError('mobility fractions must not be negative')
+
+        self.home = 1 - np.bincount(self.rows, weights = self.weights, minlength = regions)
+        if np.any(self.home < 0):
+            raise ValueError('regions {} send away more than all of their residents'.format(np.flatnonzero(self.home < 0)[:10]))
+
+        self.beta, self.sigma, self.gamma, self.mu, E, I, R, D = (
+            np.broadcast_to(np.asarray(value, dtype = np.float64), (regions,))
+            for value in (beta, sigma, gamma, mu, E, I, R, D))
+        self.initial_values = np.stack((self.population - (E + I + R + D), E, I, R, D), axis = -1)
+
+    def __len__(self):
+        return len(self.population)
+
+    def mix(self, values):
+        '''Each region's own values plus what the mobility matrix brings in from the others (M.T @ values)'''
+        return self.home * values + np.bincount(self.columns, weights = self.weights * values[self.rows], minlength = len(self))
+
+    def spread(self, values):
+        '''Values felt by the residents of each region wherever they mix (M @ values)'''
+        return self.home * values + np.bincount(self.rows, weights = self.weights * values[self.columns], minlength = len(self))
+
+    def derivatives(self, values):
+        '''
+        args:
+            values: (regions, 5) array of S, E, I, R, D values
+        returns:
+            (regions, 5) array of their time derivatives
+        '''
+        S, E, I, R, D = values.T
+        present = self.mix(S + E + I + R + D)
+        force = np.divide(self.beta * self.mix(I), present, out = np.zeros(len(self)), where = present > 0)
+        new_exposed = S * self.spread(force)
+        return np.stack((-new_exposed,
+                         new_exposed - self.sigma * E,
+                         self.sigma * E - self.gamma * I - self.mu * I,
+                         self.gamma * I,
+                         self.mu * I), axis = -1)
+
+    def run(self, time_days, integrator = 'rk4'):
+        '''
+        args:
+            time_days: length of simulation in days
+            integrator: one of DSEIR.INTEGRATORS. odeint cannot assume a banded jacobian for
+                        coupled regions and would build a dense (5 * regions)^2 one if the system
+                        turned stiff, so rk4 is the default
+        returns:
+            (time_days + 1, regions, 5) array of S, E, I, R, D values per region at each day
+        '''
+        return integrate(self.derivatives, self.initial_values, time_days, integrator, banded = False)
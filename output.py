@@ -0,0 +1,198 @@
+'''
+Streams per-day results to disk while a simulation runs. Each day's SEIRD
+counts, both the DSEIR curve and the actual agent compartment sizes, are
+appended to a columnar file, optionally along with snapshots of every agent.
+Rows are buffered for at most `chunk_days` days, so memory stays bounded no
+matter how long the run is.
+'''
+
+import os
+import zipfile
+
+import numpy as np
+
+COLUMNS = ('day',
+           'model_S', 'model_E', 'model_I', 'model_R', 'model_D',
+           'agent_S', 'agent_E', 'agent_I', 'agent_R', 'agent_D')
+AGENT_COLUMNS = ('day', 'person', 'x', 'y', 'state')
+
+
+def open_writer(path, snapshot_every = 0, chunk_days = 64):
+    '''Pick a writer from the file extension: .csv, .parquet or .npz
+
+    args:
+        path: file the daily counts are written to
+        snapshot_every: also write every agent's coordinates and state every this many days, 0 to never
+        chunk_days: number of days buffered before they are flushed to disk
+    '''
+    writers = {'.csv': CSVWriter, '.parquet': ParquetWriter, '.npz': NPZWriter}
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in writers:
+        raise ValueError('cannot write results to {}, use one of {}'.format(path, ', '.join(writers)))
+    return writers[extension](path, snapshot_every = snapshot_every, chunk_days = chunk_days)
+
+
+def agents_path(path):
+    '''File next to path holding the agent snapshots, results.csv -> results_agents.csv'''
+    stem, extension = os.path.splitext(path)
+    return '{}_agents{}'.format(stem, extension)
+
+
+class ResultsWriter():
+    '''
+    Base class buffering daily rows, subclasses implement write_rows and write_snapshot.
+    Use as a context manager or call close() to flush the last rows.
+    '''
+
+    def __init__(self, path, snapshot_every = 0, chunk_days = 64):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.chunk_days = chunk_days
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_day(self, day, model_counts, agent_counts, coordinates = None, state = None):
+        '''
+        args:
+            day: simulation day
+            model_counts: S, E, I, R, D values of the DSEIR curve on that day
+            agent_counts: number of agents in each compartment, S E I R D order
+            coordinates: (N, 2) agent coordinates, only needed for snapshots
+            state: length N agent compartment codes, only needed for snapshots
+        '''
+        self.rows.append(np.concatenate(([day], model_counts, agent_counts)))
+        if len(self.rows) >= self.chunk_days:
+            self.flush()
+        if self.snapshot_every and day % self.snapshot_every == 0 and coordinates is not None:
+            self.write_snapshot(day, coordinates, state)
+
+    def flush(self):
+        if self.rows:
+            self.write_rows(np.array(self.rows, dtype = np.float64))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+
+    def write_rows(self, rows):
+        raise NotImplementedError
+
+    def write_snapshot(self, day, coordinates, state):
+        raise NotImplementedError
+
+
+class CSVWriter(ResultsWriter):
+    '''Counts in path, snapshots as day,person,x,y,state rows in agents_path(path)'''
+
+    def __init__(self, path, snapshot_every = 0, chunk_days = 64):
+        super().__init__(path, snapshot_every, chunk_days)
+        self.file = open(path, 'w')
+        self.file.write(','.join(COLUMNS) + '\n')
+        self.agents_file = None
+
+    def write_rows(self, rows):
+        np.savetxt(self.file, rows, fmt = ['%d'] + ['%.6f'] * 5 + ['%d'] * 5, delimiter = ',')
+        self.file.flush()
+
+    def write_snapshot(self, day, coordinates, state):
+        if self.agents_file is None:
+            self.agents_file = open(agents_path(self.path), 'w')
+            self.agents_file.write(','.join(AGENT_COLUMNS) + '\n')
+        rows = np.column_stack((np.full(len(state), day), np.arange(len(state)), coordinates, state))
+        np.savetxt(self.agents_file, rows, fmt = ['%d', '%d', '%.6f', '%.6f', '%d'], delimiter = ',')
+        self.agents_file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+        if self.agents_file is not None:
+            self.agents_file.close()
+
+
+class ParquetWriter(ResultsWriter):
+    '''Counts in path, snapshots in agents_path(path), one row group per flush. Needs pyarrow'''
+
+    def __init__(self, path, snapshot_every = 0, chunk_days = 64):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('writing .parquet results needs pyarrow, pip install pyarrow or write .csv/.npz instead')
+        super().__init__(path, snapshot_every, chunk_days)
+        self.pa = pyarrow
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema(COLUMNS, ['int64'] + ['float64'] * 5 + ['int64'] * 5))
+        self.agents_writer = None
+
+    def schema(self, columns, types):
+        return self.pa.schema([(column, getattr(self.pa, kind)()) for column, kind in zip(columns, types)])
+
+    def write_rows(self, rows):
+        columns = [rows[:, 0].astype(np.int64)] + [rows[:, i] for i in range(1, 6)] + [rows[:, i].astype(np.int64) for i in range(6, 11)]
+        self.writer.write_table(self.pa.Table.from_arrays(columns, schema = self.writer.schema))
+
+    def write_snapshot(self, day, coordinates, state):
+        if self.agents_writer is None:
+            import pyarrow.parquet
+
+            self.agents_writer = pyarrow.parquet.ParquetWriter(agents_path(self.path),
+                self.schema(AGENT_COLUMNS, ['int32', 'int64', 'float64', 'float64', 'int8']))
+        columns = [np.full(len(state), day, dtype = np.int32), np.arange(len(state)),
+                   np.ascontiguousarray(coordinates[:, 0]), np.ascontiguousarray(coordinates[:, 1]), np.asarray(state, dtype = np.int8)]
+        self.agents_writer.write_table(self.pa.Table.from_arrays(columns, schema = self.agents_writer.schema))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+        if self.agents_writer is not None:
+            self.agents_writer.close()
+
+
+class NPZWriter(ResultsWriter):
+    '''
+    Single .npz archive, counts are stored in chunks named counts_<first day> and
+    snapshots as coordinates_<day> and state_<day>. Read the counts back with load_counts()
+    '''
+
+    def __init__(self, path, snapshot_every = 0, chunk_days = 64):
+        super().__init__(path, snapshot_every, chunk_days)
+        self.archive = zipfile.ZipFile(path, 'w', allowZip64 = True)
+
+    def write_array(self, name, array):
+        with self.archive.open(name + '.npy', 'w', force_zip64 = True) as file:
+            np.lib.format.write_array(file, np.asarray(array))
+
+    def write_rows(self, rows):
+        self.write_array('counts_{:06d}'.format(int(rows[0, 0])), rows)
+
+    def write_snapshot(self, day, coordinates, state):
+        self.write_array('coordinates_{:06d}'.format(day), coordinates)
+        self.write_array('state_{:06d}'.format(day), np.asarray(state, dtype = np.int8))
+
+    def close(self):
+        super().close()
+        self.archive.close()
+
+
+def load_counts(path):
+    '''
+    returns:
+        (days, len(COLUMNS)) array of the daily counts written by any of the writers
+    '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return np.loadtxt(path, delimiter = ',', skiprows = 1, ndmin = 2)
+    if extension == '.parquet':
+        import pyarrow.parquet
+
+        table = pyarrow.parquet.read_table(path)
+        return np.column_stack([table.column(column).to_numpy() for column in COLUMNS]).astype(np.float64)
+    if extension == '.npz':
+        with np.load(path) as archive:
+            chunks = sorted(name for name in archive.files if name.startswith('counts_'))
+            return np.concatenate([archive[name] for name in chunks]) if chunks else np.empty((0, len(COLUMNS)))
+    raise ValueError('cannot read results from {}'.format(path))
@@ -0,0 +1,206 @@
+'''
+Contact-mode day step spread over worker processes. The plane is cut into
+vertical strips (tiles) holding about the same number of agents at the start
+of the run, and every worker steps whole tiles directly in shared memory, so
+agent state is never pickled: each day only small task tuples travel to the
+workers. Once a day the parent sorts the agents by tile into a shared index
+buffer, so a tile only reads its own slice of it, and its halo the slices of
+the tiles within reach, instead of scanning every agent.
+
+A day runs in two phases, each a barrier across all tiles:
+
+    move: every tile random-walks the agents it held at the start of the day,
+          reading the current coordinates and writing the other coordinate buffer
+    transition: every tile takes the agents now inside it, lets its infected meet
+                susceptible people within args.radius, including those across the
+                boundary in a halo of neighbouring tiles, and draws the exposures and
+                progressions of update_contacts() into a shared next-state array
+
+An exposure only ever writes EXPOSED over a susceptible agent, so two tiles
+exposing the same agent across a boundary agree. Every tile draws from its own
+stream seeded by (entropy, day, tile), so a run depends on its seed and the
+number of tiles but not on the number of workers or on scheduling.
+'''
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+from population import DEAD, EXPOSED, INFECTED, RECOVERED, SUSCEPTIBLE
+from scipy.spatial import cKDTree
+from simulation import draw_exposures, draw_progressions
+
+TILES = 64
+MOVE, TRANSITION = 0, 1
+
+# views of the shared buffers inside a worker, set by attach()
+shared = {}
+
+
+def attach(names, shapes, settings):
+    '''Pool initializer, maps the shared buffers into the worker'''
+    shared.clear()
+    shared['memory'] = [shared_memory.SharedMemory(name = name) for name in names]
+    shared['coordinates'] = np.ndarray(shapes['coordinates'], dtype = np.float64, buffer = shared['memory'][0].buf)
+    shared['state'] = np.ndarray(shapes['state'], dtype = np.int8, buffer = shared['memory'][1].buf)
+    shared['next_state'] = np.ndarray(shapes['state'], dtype = np.int8, buffer = shared['memory'][2].buf)
+    shared['order'] = np.ndarray(shapes['state'], dtype = np.int64, buffer = shared['memory'][3].buf)
+    shared.update(settings)
+
+
+def tile_generator(day, tile, phase):
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence([shared['entropy'], day, tile, phase])))
+
+
+def run_tile(task):
+    '''
+    Run one phase of one tile, called in a worker process
+
+    returns:
+        for the transition phase, the number of infected agents queried and of contacts they found
+    '''
+    phase, day, tile, current, (start, stop), (halo_start, halo_stop) = task
+    low, high = shared['edges'][tile], shared['edges'][tile + 1]
+    coordinates, state, next_state = shared['coordinates'], shared['state'], shared['next_state']
+    rng = tile_generator(day, tile, phase)
+    # the tile's agents in ascending order, see ParallelStepper.bucket
+    people = shared['order'][start:stop]
+
+    if phase == MOVE:
+        # same walk as Population.take_step
+        radian_direction = rng.integers(low = 0, high = 360, size = len(people)) * np.pi / 180
+        coordinates[1 - current, people, 0] = coordinates[current, people, 0] + shared['step_size'] * np.cos(radian_direction)
+        coordinates[1 - current, people, 1] = coordinates[current, people, 1] + shared['step_size'] * np.sin(radian_direction)
+        return
+
+    points, radius = coordinates[current], shared['radius']
+    # manhattan reach never crosses more than radius in x, so the halo around the tile covers every contact:
+    # the tile's own agents and those of the neighbouring buckets within reach, sorted like the tile
+    neighbours = np.concatenate((shared['order'][halo_start:start], shared['order'][stop:halo_stop]))
+    x = points[neighbours, 0]
+    halo = np.sort(np.concatenate((people, neighbours[(x >= low - radius) & (x <= high + radius)])))
+    infected_people = people[state[people] == INFECTED]
+    exposed_people = people[state[people] == EXPOSED]
+    susceptible = halo[state[halo] == SUSCEPTIBLE]
+    infectors, contacts = np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int64)
+    if len(infected_people) and len(susceptible):
+        # unbalanced trees like SpatialIndex, much quicker to build for a single query
+        tree = cKDTree(points[susceptible], balanced_tree = False, compact_nodes = False)
+        pairs = cKDTree(points[infected_people]).sparse_distance_matrix(tree, radius, p = 1, output_type = 'ndarray')
+        infectors, contacts = pairs['i'], susceptible[pairs['j']]
+
+    settings = shared['args']
+    new_exposed = draw_exposures(rng, infectors, contacts, len(infected_people), settings['numb'], settings['prob'])
+    new_infected, new_dead, new_recovered = draw_progressions(rng, exposed_people, infected_people,
+                                                              settings['sig'], settings['gam'], settings['mu'])
+    next_state[new_exposed] = EXPOSED
+    next_state[new_infected] = INFECTED
+    next_state[new_dead] = DEAD
+    next_state[new_recovered] = RECOVERED
+    return len(infected_people), len(contacts)
+
+
+class ParallelStepper():
+    '''
+    Owns the shared buffers and the worker pool of a contact-mode Simulation.
+    The population's coordinates and state arrays are rebound to views of the
+    shared buffers, so everything else (recording, checkpoints, rendering) keeps
+    reading them as before.
+    '''
+
+    def __init__(self, simulation, workers, entropy, tiles = TILES, edges = None, step_size = 0.1):
+        '''
+        args:
+            simulation: contact-mode Simulation to step
+            workers: number of worker processes
+            entropy: integer seeding every tile's streams
+            tiles: number of strips, the results depend on it
+            edges: tiles + 1 strip edges in x, at the quantiles of the starting positions if not given
+            step_size: length of each day's random step, as Population.take_step
+        '''
+        population = simulation.population
+        self.simulation, self.population = simulation, population
+        number_people = len(population)
+
+        if edges is None:
+            # strip edges at the quantiles of x at the start, open ended on both sides
+            edges = np.quantile(population.coordinates[:, 0], np.linspace(0, 1, tiles + 1)) if number_people else np.zeros(tiles + 1)
+            edges[0], edges[-1] = -np.inf, np.inf
+        self.edges = np.asarray(edges, dtype = np.float64)
+        self.workers, self.tiles, self.entropy = workers, len(self.edges) - 1, int(entropy)
+
+        shapes = {'coordinates': (2, number_people, 2), 'state': (number_people,)}
+        sizes = (max(16 * number_people * 2, 1), max(number_people, 1), max(number_people, 1), max(8 * number_people, 1))
+        self.memory = [shared_memory.SharedMemory(create = True, size = size) for size in sizes]
+        self.coordinates = np.ndarray(shapes['coordinates'], dtype = np.float64, buffer = self.memory[0].buf)
+        self.state = np.ndarray(shapes['state'], dtype = np.int8, buffer = self.memory[1].buf)
+        self.next_state = np.ndarray(shapes['state'], dtype = np.int8, buffer = self.memory[2].buf)
+        # agents sorted by tile, offsets[tile]:offsets[tile + 1] being the slice of each tile
+        self.order = np.ndarray(shapes['state'], dtype = np.int64, buffer = self.memory[3].buf)
+        self.offsets = None
+
+        self.current = 0
+        self.coordinates[self.current] = population.coordinates
+        self.state[:] = population.state
+        population.coordinates, population.state = self.coordinates[self.current], self.state
+
+        args = simulation.args
+        # first and last tile within radius of each tile, whose buckets hold its halo
+        reach = float(args.radius)
+        self.halo_tiles = (np.clip(np.searchsorted(self.edges, self.edges[:-1] - reach, side = 'right') - 1, 0, self.tiles - 1),
+                           np.clip(np.searchsorted(self.edges, self.edges[1:] + reach, side = 'right') - 1, 0, self.tiles - 1))
+        settings = {'edges': self.edges, 'entropy': self.entropy, 'radius': float(args.radius), 'step_size': step_size,
+                    'args': {name: float(getattr(args, name)) for name in ('numb', 'prob', 'sig', 'gam', 'mu')}}
+        self.pool = multiprocessing.Pool(workers, initializer = attach,
+                                         initargs = ([memory.name for memory in self.memory], shapes, settings))
+
+    def settings(self):
+        '''What a resumed run needs to continue with the same streams, see checkpoint.py'''
+        return {'entropy': self.entropy, 'edges': self.edges.tolist()}
+
+    def bucket(self):
+        '''Sort the agents by the tile their current x falls in, ascending within each tile'''
+        tile_of = np.searchsorted(self.edges, self.coordinates[self.current, :, 0], side = 'right') - 1
+        # a stable sort of small integers is a radix sort, linear in the number of agents
+        self.order[:] = np.argsort(tile_of.astype(np.min_scalar_type(self.tiles)), kind = 'stable')
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(tile_of, minlength = self.tiles))))
+
+    def tasks(self, phase, day):
+        offsets, (first, last) = self.offsets, self.halo_tiles
+        return [(phase, day, tile, self.current, (offsets[tile], offsets[tile + 1]), (offsets[first[tile]], offsets[last[tile] + 1]))
+                for tile in range(self.tiles)]
+
+    def step(self, day):
+        '''Move everyone and apply the transitions of `day`, updating the population in place'''
+        # the buckets of the last transition still hold, nobody has moved since
+        if self.offsets is None:
+            self.bucket()
+        self.pool.map(run_tile, self.tasks(MOVE, day))
+        self.current = 1 - self.current
+        self.population.coordinates = self.coordinates[self.current]
+
+        self.bucket()
+        self.next_state[:] = self.state
+        totals = self.pool.map(run_tile, self.tasks(TRANSITION, day))
+        queries, contacts = np.sum(totals, axis = 0, dtype = np.int64) if totals else (0, 0)
+        self.simulation.profiler.count('neighbour_queries', queries)
+        self.simulation.profiler.count('contacts', contacts)
+
+        # hand the changes to the population through Simulation.move, so its pools follow the state
+        # and the profiler gets the same new_* counts as a serial day
+        changed = np.flatnonzero(self.next_state != self.state)
+        for compartment in (EXPOSED, INFECTED, DEAD, RECOVERED):
+            self.simulation.move(changed[self.next_state[changed] == compartment], compartment)
+
+    def close(self):
+        '''Stop the workers and free the shared buffers, the population keeps private copies'''
+        if self.pool is None:
+            return
+        self.pool.close()
+        self.pool.join()
+        self.pool = None
+        self.population.coordinates = self.population.coordinates.copy()
+        self.population.state = self.population.state.copy()
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
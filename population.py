@@ -0,0 +1,134 @@
+import math
+
+import numpy as np
+
+# compartment codes stored in Population.state
+SUSCEPTIBLE, EXPOSED, INFECTED, RECOVERED, DEAD = 0, 1, 2, 3, 4
+COMPARTMENTS = ('SUSCEPTIBLE', 'EXPOSED', 'INFECTED', 'RECOVERED', 'DEAD')
+
+
+class Population():
+    '''
+    Array-backed store for every person in the simulation. Positions live in a
+    single (N, 2) float array and compartment membership in a single int8 state
+    array, so the whole population is stepped and queried in one call instead of
+    looping over person objects.
+
+    Each compartment also keeps an index pool of its members. People leave a pool
+    by swap-remove, so sampling k members of a compartment and moving them to
+    another one costs O(k) no matter how large the population is.
+    '''
+
+    def __init__(self, coordinates, state = None, rng = None, pools = None):
+        '''
+        args:
+            coordinates: (N, 2) array of x, y positions
+            state: optional length N array of compartment codes, defaults to all SUSCEPTIBLE
+            rng: np.random.Generator used for every random draw, a fresh one if not given
+            pools: optional members of each compartment in pool order (e.g. from a checkpoint),
+                   rebuilt from state if not given
+        '''
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.coordinates = np.asarray(coordinates, dtype = np.float64).reshape(-1, 2)
+        if state is None:
+            state = np.full(len(self.coordinates), SUSCEPTIBLE)
+        self.state = np.asarray(state, dtype = np.int8)
+        if pools is None:
+            self.build_pools()
+        else:
+            self.set_pools(pools)
+
+    def __len__(self):
+        return len(self.state)
+
+    def take_step(self, step_size = None):
+        '''
+        Move every person one step in a random direction. Utilized as part of
+        random simulation but not SEIRD modeling
+        '''
+        if step_size is None:
+            step_size = 0.1
+        degree_direction = self.rng.integers(low = 0, high = 360, size = len(self))
+        radian_direction = (degree_direction * math.pi) / 180
+        self.coordinates[:, 0] += step_size * np.cos(radian_direction)
+        self.coordinates[:, 1] += step_size * np.sin(radian_direction)
+
+    def build_pools(self):
+        '''(Re)build every compartment pool from the state array'''
+        self.set_pools([np.flatnonzero(self.state == compartment) for compartment in range(len(COMPARTMENTS))])
+
+    def set_pools(self, pools):
+        '''Take over the given members of each compartment, in that order'''
+        self.pools, self.sizes = [], np.zeros(len(COMPARTMENTS), dtype = np.int64)
+        # slot of each person inside the pool of their compartment
+        self.position = np.empty(len(self), dtype = np.int64)
+        for compartment, members in enumerate(pools):
+            pool = np.empty(max(len(members), 16), dtype = np.int64)
+            pool[:len(members)] = members
+            self.pools.append(pool)
+            self.sizes[compartment] = len(members)
+            self.position[members] = np.arange(len(members))
+
+    def members(self, compartment):
+        '''Indices of all people currently in a compartment'''
+        return self.pools[compartment][:self.sizes[compartment]].copy()
+
+    def count(self, compartment):
+        return int(self.sizes[compartment])
+
+    def counts(self):
+        '''Number of people in each compartment, S E I R D order'''
+        return self.sizes.copy()
+
+    def positions(self, compartment):
+        '''
+        returns:
+            x and y coordinate arrays of everyone in a compartment, ready for plotting
+        '''
+        coordinates = self.coordinates[self.pools[compartment][:self.sizes[compartment]]]
+        return coordinates[:, 0], coordinates[:, 1]
+
+    def sample(self, compartment, number):
+        '''
+        Draw distinct random members of a compartment.
+
+        returns:
+            indices of min(number, count) people, empty if number <= 0
+        '''
+        size = self.sizes[compartment]
+        number = min(max(number, 0), size)
+        return self.pools[compartment][self.rng.choice(size, number, replace = False)]
+
+    def move(self, people, compartment):
+        '''Move one index or an array of distinct indices into another compartment'''
+        people = np.atleast_1d(people)
+        current = self.state[people]
+        for source in np.unique(current):
+            self.remove_from_pool(source, people[current == source])
+        self.add_to_pool(compartment, people)
+        self.state[people] = compartment
+
+    def remove_from_pool(self, compartment, people):
+        pool, size = self.pools[compartment], self.sizes[compartment]
+        new_size = size - len(people)
+        slots = self.position[people]
+
+        # members sitting past the new end of the pool fill the holes left by the removed people
+        leaving_tail = np.zeros(size - new_size, dtype = bool)
+        leaving_tail[slots[slots >= new_size] - new_size] = True
+        holes = slots[slots < new_size]
+        fillers = pool[new_size:size][~leaving_tail]
+
+        pool[holes] = fillers
+        self.position[fillers] = holes
+        self.sizes[compartment] = new_size
+
+    def add_to_pool(self, compartment, people):
+        size = self.sizes[compartment]
+        if size + len(people) > len(self.pools[compartment]):
+            pool = np.empty(max(2 * len(self.pools[compartment]), size + len(people)), dtype = np.int64)
+            pool[:size] = self.pools[compartment][:size]
+            self.pools[compartment] = pool
+        self.pools[compartment][size:size + len(people)] = people
+        self.position[people] = np.arange(size, size + len(people))
+        self.sizes[compartment] = size + len(people)
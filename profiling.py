@@ -0,0 +1,125 @@
+'''
+Stage timers and counters for simulation runs. Simulation, Renderer and the
+transition code report to a profiler through `stage(name)` blocks and
+`count(name, value)` calls; the default NullProfiler ignores both, so an
+unprofiled run pays one no-op call per stage per day and nothing per agent.
+
+    profiler = Profiler()
+    simulation = Simulation(args, headless = True, profiler = profiler)
+    simulation.run_headless(100)
+    print(profiler.summary())
+    profiler.save('profile.json')
+'''
+
+import json
+import time
+from collections import defaultdict
+
+
+class NullStage():
+    '''Reusable context manager that does nothing'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class NullProfiler():
+    '''Profiler interface that records nothing, used when profiling is off'''
+
+    enabled = False
+
+    def stage(self, name):
+        return NULL_STAGE
+
+    def count(self, name, value = 1):
+        pass
+
+    def end_day(self, day):
+        pass
+
+
+class Stage():
+
+    def __init__(self, profiler, name):
+        self.profiler, self.name = profiler, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler(NullProfiler):
+    '''
+    Accumulates seconds and calls per stage and totals per counter, over the
+    whole run and per simulated day. Stages may nest (e.g. 'update' inside
+    'step'), each one is timed on its own.
+    '''
+
+    enabled = True
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.seconds, self.calls, self.counters = defaultdict(float), defaultdict(int), defaultdict(int)
+        self.days = []
+        self.day_seconds, self.day_counters = defaultdict(float), defaultdict(int)
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def add_time(self, name, seconds):
+        self.seconds[name] += seconds
+        self.calls[name] += 1
+        self.day_seconds[name] += seconds
+
+    def count(self, name, value = 1):
+        self.counters[name] += int(value)
+        self.day_counters[name] += int(value)
+
+    def end_day(self, day):
+        '''Close the current day's record, everything reported since the last call belongs to `day`'''
+        self.days.append({'day': day, 'seconds': dict(self.day_seconds), 'counters': dict(self.day_counters)})
+        self.day_seconds, self.day_counters = defaultdict(float), defaultdict(int)
+
+    def wall_time(self):
+        return time.perf_counter() - self.start
+
+    def summary(self):
+        '''
+        returns:
+            table of every stage's total seconds, calls, mean and share of the wall time,
+            followed by the counter totals
+        '''
+        wall = self.wall_time()
+        lines = ['{:<34} {:>10} {:>8} {:>12} {:>7}'.format('stage', 'seconds', 'calls', 'ms/call', '% wall')]
+        for name in sorted(self.seconds, key = self.seconds.get, reverse = True):
+            seconds, calls = self.seconds[name], self.calls[name]
+            lines.append('{:<34} {:>10.3f} {:>8} {:>12.3f} {:>7.1f}'.format(name, seconds, calls, 1000 * seconds / calls,
+                                                                           100 * seconds / wall if wall else 0))
+        lines.append('{:<34} {:>10.3f}'.format('wall', wall))
+        if self.counters:
+            lines.append('')
+            lines.append('{:<34} {:>10} {:>12}'.format('counter', 'total', 'per day'))
+            for name in sorted(self.counters):
+                lines.append('{:<34} {:>10} {:>12.1f}'.format(name, self.counters[name], self.counters[name] / max(len(self.days), 1)))
+        return '\n'.join(lines)
+
+    def trace(self):
+        return {'wall_seconds': self.wall_time(),
+                'stages': {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self.seconds},
+                'counters': dict(self.counters),
+                'days': self.days}
+
+    def save(self, path):
+        '''Write the run totals and the per-day records to a JSON file'''
+        with open(path, 'w') as file:
+            json.dump(self.trace(), file, indent = 2)
@@ -0,0 +1,133 @@
+'''
+Draws a Simulation: agent positions coloured by compartment above the DSEIR
+curve. Artists are created once and updated in place from the population's
+arrays, only every `every`-th day is drawn, and frames are encoded in-process
+(Pillow for .gif, an ffmpeg pipe for video) or dumped as PNG files.
+'''
+
+import math
+import os
+
+from population import COMPARTMENTS, DEAD, EXPOSED, INFECTED, RECOVERED, SUSCEPTIBLE
+
+STYLES = {SUSCEPTIBLE: 'bo', EXPOSED: 'mo', INFECTED: 'ro', RECOVERED: 'go', DEAD: 'ko'}
+LINE_STYLES = {SUSCEPTIBLE: 'b', EXPOSED: 'm', INFECTED: 'r', RECOVERED: 'g', DEAD: 'k'}
+LABELS = {SUSCEPTIBLE: 'healthy', EXPOSED: 'exposed', INFECTED: 'infected', RECOVERED: 'recovered', DEAD: 'dead'}
+# writers picked from the output file extension when none is given
+WRITERS = {'.gif': 'pillow', '.mp4': 'ffmpeg', '.mkv': 'ffmpeg', '.webm': 'ffmpeg', '': 'frames'}
+
+
+class Renderer():
+
+    def __init__(self, simulation, every = 1):
+        '''
+        args:
+            simulation: Simulation to draw, stepped by the renderer
+            every: draw every this many days
+        '''
+        from matplotlib import pyplot as plt
+
+        self.simulation = simulation
+        self.every = every
+        # day the current animation ends on, its last frame only steps up to it
+        self.end_day = None
+        population = simulation.population
+        days = simulation.DSEIR_values[-1]
+
+        self.fig, self.axs = plt.subplots(2, figsize = (10,10))
+        self.axs[0].set_xlim(0, len(days))
+        self.axs[0].set_ylim(0, len(population))
+
+        # blitting never rescales the axes, so leave room for people to wander off the grid
+        low, high = population.coordinates.min(axis = 0) - 2, population.coordinates.max(axis = 0) + 2
+        self.axs[1].set_xlim(low[0], high[0])
+        self.axs[1].set_ylim(low[1], high[1])
+
+        self.dots = [self.axs[1].plot(*population.positions(compartment), STYLES[compartment], markersize = 2)[0]
+                     for compartment in range(len(COMPARTMENTS))]
+        self.lines = [self.axs[0].plot((0, 0), LINE_STYLES[compartment])[0]
+                      for compartment in range(len(COMPARTMENTS))]
+        self.legend = self.axs[0].legend(self.lines, self.labels(), loc = 'upper left')
+        self.artists = self.dots + self.lines + self.legend.get_texts()
+
+    def labels(self):
+        counts = self.simulation.population.counts()
+        return ['{}: {}'.format(LABELS[compartment], counts[compartment]) for compartment in range(len(COMPARTMENTS))]
+
+    def init_frame(self):
+        '''Blitting background, the artists already show the current day'''
+        return self.artists
+
+    def draw_frame(self, frame):
+        '''Advance the simulation by `every` days (none on frame 0, fewer on the last) and update every artist from the arrays'''
+        days = self.every if self.end_day is None else min(self.every, self.end_day - self.simulation.day)
+        if frame == 0:
+            days = 0
+        for day in range(days):
+            self.simulation.step()
+
+        simulation = self.simulation
+        with simulation.profiler.stage('draw'):
+            for compartment, dots in enumerate(self.dots):
+                dots.set_data(*simulation.population.positions(compartment))
+
+            days = simulation.DSEIR_values[-1][0:simulation.day]
+            for compartment, line in enumerate(self.lines):
+                line.set_data(days, simulation.DSEIR_values[compartment][0:simulation.day])
+
+        with simulation.profiler.stage('legend'):
+            for text, label in zip(self.legend.get_texts(), self.labels()):
+                text.set_text(label)
+
+        return self.artists
+
+    def animation(self, number_days, interval = 50):
+        from matplotlib import animation
+
+        self.end_day = self.simulation.day + number_days
+        return animation.FuncAnimation(self.fig, self.draw_frame, frames = self.frames(number_days),
+                                       init_func = self.init_frame, interval = interval, blit = True, repeat = False)
+
+    def frames(self, number_days):
+        '''Frames drawn for number_days: the starting day, then one every `every` days, the last covering the days left over'''
+        return 1 + math.ceil(max(number_days, 0) / self.every)
+
+    def show(self, number_days):
+        from matplotlib import pyplot as plt
+
+        anim = self.animation(number_days)
+        plt.show()
+        return anim
+
+    def save(self, path, number_days, writer = None, fps = 5):
+        '''
+        Render number_days of simulation to a file
+
+        args:
+            path: output file, or directory for the 'frames' writer
+            number_days: days to simulate, a frame is drawn of the starting day, every `every` days and the last day
+            writer: 'pillow' (in-process, gif), 'ffmpeg' (pipe, any video format), 'imagemagick'
+                    or 'frames' (one PNG per frame in the directory `path`), picked from the
+                    extension of path if not given
+            fps: frames per second of the encoded file
+        '''
+        if writer is None:
+            writer = WRITERS.get(os.path.splitext(path)[1].lower(), 'ffmpeg')
+
+        if writer == 'frames':
+            os.makedirs(path, exist_ok = True)
+            self.end_day = self.simulation.day + number_days
+            for frame in range(self.frames(number_days)):
+                self.draw_frame(frame)
+                with self.simulation.profiler.stage('encode'):
+                    self.fig.savefig(os.path.join(path, 'frame_{:05d}.png'.format(frame)))
+            return
+
+        from matplotlib import animation
+
+        writers = {'pillow': animation.PillowWriter, 'ffmpeg': animation.FFMpegWriter, 'imagemagick': animation.ImageMagickWriter}
+        if writer not in writers:
+            raise ValueError('unknown writer {}, choose one of {}'.format(writer, ', '.join(list(writers) + ['frames'])))
+        # rasterizing and encoding happen inside the writer, their time is 'render' minus the stages it calls
+        with self.simulation.profiler.stage('render'):
+            self.animation(number_days).save(path, writer = writers[writer](fps = fps))
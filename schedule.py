@@ -0,0 +1,106 @@
+'''
+Intervention schedules for the DSEIR model: changes to beta, sigma, gamma or mu
+from a given day on, e.g. a lockdown lowering beta on day 30 and a reopening
+raising it again on day 90:
+
+    [{'day': 30, 'beta': .3}, {'day': 90, 'beta': .8}]
+
+Schedules are read from JSON (a list of such objects) or CSV (a day column and
+one column per parameter, empty cells leave it unchanged). The solver splits
+the run at every change day and integrates each segment from the state the
+previous one ended in, see DSEIR.integrate_schedule.
+'''
+
+import csv
+import json
+import os
+
+import numpy as np
+
+PARAMETERS = ('beta', 'sigma', 'gamma', 'mu')
+
+
+def load_schedule(path):
+    '''
+    returns:
+        list of changes, dicts holding 'day' and the new value of any of PARAMETERS
+    '''
+    if os.path.splitext(path)[1].lower() == '.json':
+        with open(path) as file:
+            return check_schedule(json.load(file))
+
+    with open(path, newline = '') as file:
+        changes = [{name: float(value) for name, value in row.items() if value not in (None, '')}
+                   for row in csv.DictReader(file)]
+    return check_schedule(changes)
+
+
+def check_schedule(changes):
+    '''Validate a list of changes and sort it by day, later entries win on the same day'''
+    checked = []
+    for change in changes:
+        change = dict(change)
+        if 'day' not in change:
+            raise ValueError('schedule change {} has no day'.format(change))
+        unknown = set(change) - set(PARAMETERS) - {'day'}
+        if unknown:
+            raise ValueError('unknown schedule parameters {}, choose from {}'.format(sorted(unknown), PARAMETERS))
+        if change['day'] != int(change['day']):
+            raise ValueError('schedule days must be whole days, got {}'.format(change['day']))
+        change['day'] = int(change['day'])
+        checked.append(change)
+    return sorted(checked, key = lambda change: change['day'])
+
+
+def as_schedule(schedule):
+    '''A schedule given as a file path, a list of changes or None (no changes)'''
+    if schedule is None:
+        return []
+    if isinstance(schedule, str):
+        return load_schedule(schedule)
+    return check_schedule(schedule)
+
+
+def freeze(schedule):
+    '''Hashable form of a schedule, e.g. for cache keys'''
+    return tuple((change['day'],) + tuple((name, tuple(np.ravel(change[name]).tolist())) for name in PARAMETERS if name in change)
+                 for change in as_schedule(schedule))
+
+
+def segments(time_days, schedules, base, per_set = False):
+    '''
+    Split a run at every change day and give the parameters in force during each part.
+
+    args:
+        time_days: length of the run in days
+        schedules: one schedule shared by every parameter set, whose values may be scalars or
+                   arrays over the sets, or with per_set a list of one schedule per set
+        base: dict of every name in PARAMETERS to its starting value, a scalar or (n_sets,) array
+        per_set: whether schedules holds one schedule per parameter set
+    returns:
+        list of (start day, end day, dict of parameter arrays shaped like base) covering 0 to time_days,
+        changes on or before day 0 apply from the start and those from time_days on are ignored;
+        a run of 0 days is a single (0, 0, parameters) segment
+    '''
+    if not per_set:
+        schedules = [schedules]
+    schedules = [as_schedule(schedule) for schedule in schedules]
+    days = sorted({0, time_days} | {change['day'] for schedule in schedules for change in schedule if 0 < change['day'] < time_days})
+    if len(days) == 1:
+        days = [0, 0]
+
+    current = {name: np.array(base[name], dtype = np.float64) for name in PARAMETERS}
+    result = []
+    for start, end in zip(days[:-1], days[1:]):
+        current = {name: values.copy() for name, values in current.items()}
+        for set_index, schedule in enumerate(schedules):
+            for change in schedule:
+                if change['day'] == start or (start == 0 and change['day'] < 0):
+                    for name in PARAMETERS:
+                        if name in change:
+                            if per_set:
+                                current[name][set_index] = change[name]
+                            else:
+                                current[name][...] = change[name]
+        result.append((start, end, current))
+    return result
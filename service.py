@@ -0,0 +1,413 @@
+'''
+Long-lived local HTTP service for DSEIR solves and headless simulations, so
+a scenario costs a request instead of a fresh interpreter. Built on asyncio
+streams alone:
+
+    python -m service --port 8000 --workers 4
+
+    POST /dseir     {"TP": 10000, "prob": 0.1, "TD": 160, ...}
+                    -> {"days": 160, "S": [...], "E": [...], "I": [...], "R": [...], "D": [...]}
+    POST /simulate  {"TP": 10000, "TD": 100, "seed": 1, "mode": "contact", ...}
+                    -> newline delimited JSON, {"day": d, "model": [S, E, I, R, D], "agents": [...]}
+                       per day, sent as soon as the day is simulated
+    GET  /health
+
+Parameters take the names of main.py's arguments (TP, prob, sig, integrator, ...),
+missing ones keep its defaults, and schedules are given inline as a list of
+changes (see schedule.py). DSEIR requests arriving within the batch window of
+each other are solved together in one DSEIR.sweep per run length and integrator,
+and every solution is cached (see cache.py). Simulations run in a process pool.
+'''
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from cache import PARAMETERS, DSEIRCache
+from DSEIR import INTEGRATORS, sweep
+from layouts import LAYOUTS
+from main import get_parser
+from output import ResultsWriter
+from schedule import as_schedule, check_schedule
+from simulation import Simulation
+
+# /dseir accepts the parameters of the solve, /simulate everything but files, rendering and nested pools
+DSEIR_OPTIONS = tuple(name for name, _ in PARAMETERS) + ('schedule',)
+SIMULATE_EXCLUDED = ('output', 'snapshot_every', 'checkpoint', 'checkpoint_every', 'resume', 'cache_dir', 'cache_size',
+                     'profile', 'video', 'writer', 'render_every', 'fps', 'headless', 'replicates', 'processes',
+                     'workers', 'density')
+# main.py defaults, parsed once instead of building a parser per request
+DEFAULTS = vars(get_parser().parse_args([]))
+MAX_BODY = 2 ** 20
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+# counts of people are whole numbers, the rates and contacts any finite number
+COUNTS = ('E', 'I', 'R', 'D', 'TP')
+RATES = ('sig', 'gam', 'mu', 'prob', 'numb')
+MODES = ('curve', 'contact')
+
+
+class RequestError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def number(name, value, whole = False):
+    '''A JSON number as a finite float, or a non-negative int with whole; bools and strings are refused'''
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError('{} must be a finite number, got {!r}'.format(name, value))
+    if whole:
+        if value != int(value) or value < 0:
+            raise ValueError('{} must be a whole number of at least 0, got {!r}'.format(name, value))
+        return int(value)
+    return float(value)
+
+
+def check_changes(changes):
+    '''A request's schedule, whose values must be numbers: the per-set arrays of DSEIR.sweep are not offered'''
+    if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+        raise ValueError('schedule must be a list of changes')
+    changes = [{name: number(name, value) for name, value in change.items()} for change in changes]
+    return check_schedule(changes)
+
+
+def make_args(options, allowed = None, excluded = ()):
+    '''
+    main.py defaults overridden by the options of a request
+
+    args:
+        options: dict of argument names to values
+        allowed: names that may be given, any argument of main.py if None
+        excluded: names that may not be given
+    '''
+    if not isinstance(options, dict):
+        raise RequestError(400, 'request body must be a JSON object')
+    args = argparse.Namespace(**DEFAULTS)
+    for name, value in options.items():
+        if name not in vars(args) or name in excluded or (allowed is not None and name not in allowed):
+            raise RequestError(400, 'unknown parameter {}'.format(name))
+        setattr(args, name, value)
+
+    try:
+        # store the checked values, so the solver and the cache only ever see numbers
+        for name in COUNTS + ('TD',):
+            setattr(args, name, number(name, getattr(args, name), whole = True))
+        for name in RATES:
+            setattr(args, name, number(name, getattr(args, name)))
+        if args.TP <= 0:
+            raise ValueError('TP must be at least 1')
+        if args.E + args.I + args.R + args.D > args.TP:
+            raise ValueError('E + I + R + D must not exceed TP')
+        if args.integrator not in INTEGRATORS:
+            raise ValueError('unknown integrator {}, choose one of {}'.format(args.integrator, INTEGRATORS))
+        # the rest only reaches /simulate, checked here so a bad request never gets a 200 and a broken stream
+        if args.seed is not None:
+            args.seed = number('seed', args.seed, whole = True)
+        if args.mode is not None and args.mode not in MODES:
+            raise ValueError('unknown mode {}, choose one of {}'.format(args.mode, MODES))
+        args.radius = number('radius', args.radius)
+        if args.radius <= 0:
+            raise ValueError('radius must be positive')
+        if args.layout not in LAYOUTS:
+            raise ValueError('unknown layout {}, choose one of {}'.format(args.layout, LAYOUTS))
+        if args.layout == 'clustered' and args.density is None:
+            raise ValueError('the clustered layout needs a density, which requests cannot give')
+        if args.schedule is not None:
+            # never read files named by a request
+            args.schedule = check_changes(args.schedule)
+    except (TypeError, ValueError) as error:
+        raise RequestError(400, str(error))
+    return args
+
+
+def solve_batch(batch):
+    '''
+    Solve the DSEIR curves of many args sharing TD and integrator in one sweep
+
+    returns:
+        (len(batch), 5, TD + 1) array of S, E, I, R, D values per day
+    '''
+    first = batch[0]
+    values = {name: [float(getattr(args, name)) for args in batch] for name in ('E', 'I', 'R', 'D', 'TP', 'sig', 'gam', 'mu')}
+    results = sweep(beta = [args.prob * args.numb for args in batch], sigma = values['sig'], gamma = values['gam'],
+                    mu = values['mu'], E = values['E'], I = values['I'], R = values['R'], D = values['D'],
+                    total_people = values['TP'], time_days = first.TD, integrator = first.integrator,
+                    schedule = [as_schedule(args.schedule) for args in batch])
+    return results.transpose(0, 2, 1)
+
+
+class DSEIRBatcher():
+    '''
+    Collects DSEIR requests for `window` seconds after the first one and solves
+    them together, grouped by run length and integrator. Cached solutions are
+    answered at once. Sweeps run in `executor`, the loop's default one if None.
+    '''
+
+    def __init__(self, cache, window = 0.002, max_batch = 4096, executor = None):
+        self.cache, self.executor = cache, executor
+        self.window, self.max_batch = window, max_batch
+        self.pending = []
+        self.timer = None
+        # running batches, referenced so they are not collected before they finish
+        self.running = set()
+
+    async def solve(self, args):
+        '''
+        returns:
+            read-only (5, TD + 1) array of S, E, I, R, D values per day
+        '''
+        values = self.cache.lookup(args)
+        if values is not None:
+            return values
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((args, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        groups = {}
+        for args, future in batch:
+            groups.setdefault((args.TD, args.integrator), []).append((args, future))
+        for group in groups.values():
+            task = asyncio.ensure_future(self.run(group))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def run(self, group):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, solve_batch, [args for args, _ in group])
+        except Exception as error:
+            if len(group) == 1:
+                if not group[0][1].done():
+                    group[0][1].set_exception(error)
+                return
+            # one bad request must not fail the others, solve every member on its own
+            await asyncio.gather(*(self.run([member]) for member in group))
+            return
+        for (args, future), values in zip(group, results):
+            values = self.cache.put(args, np.ascontiguousarray(values))
+            if not future.done():
+                future.set_result(values)
+
+
+class Cancelled(Exception):
+    pass
+
+
+class QueueWriter(ResultsWriter):
+    '''Sends every simulated day through a multiprocessing queue, stops the run once cancelled is set'''
+
+    def __init__(self, queue, cancelled):
+        super().__init__(None, chunk_days = 1)
+        self.queue, self.cancelled = queue, cancelled
+
+    def write_rows(self, rows):
+        if self.cancelled.is_set():
+            raise Cancelled()
+        for row in rows:
+            self.queue.put({'day': int(row[0]),
+                            'model': [None if math.isnan(value) else value for value in row[1:6].tolist()],
+                            'agents': [int(value) for value in row[6:11]]})
+
+    def write_snapshot(self, day, coordinates, state):
+        pass
+
+
+def simulate(args, queue, cancelled):
+    '''Run one headless simulation in a worker process, streaming each day into queue and None when done'''
+    try:
+        simulation = Simulation(args, headless = True, seed = args.seed, writer = QueueWriter(queue, cancelled))
+        simulation.run_headless(number_days = args.TD)
+    except Cancelled:
+        pass
+    except Exception as error:
+        queue.put({'error': '{}: {}'.format(type(error).__name__, error)})
+    finally:
+        queue.put(None)
+
+
+async def read_request(reader):
+    '''
+    returns:
+        method, path, lower-cased headers and body of the next request, None once the client is gone
+    '''
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, path, _ = line.decode('latin-1').split()
+    except ValueError:
+        raise RequestError(400, 'malformed request line')
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0) or 0)
+    if length > MAX_BODY:
+        raise RequestError(413, 'request body over {} bytes'.format(MAX_BODY))
+    body = await reader.readexactly(length) if length else b''
+    return method, path.split('?')[0], headers, body
+
+
+async def respond(writer, status, payload):
+    body = json.dumps(payload).encode()
+    writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+                 .format(status, REASONS[status], len(body)).encode() + body)
+    await writer.drain()
+
+
+class Service():
+
+    def __init__(self, workers = None, window = 0.002, cache_dir = None, cache_size = 256):
+        '''
+        args:
+            workers: size of the simulation process pool, defaults to the number of cores
+            window: seconds DSEIR requests wait for others to batch with
+            cache_dir, cache_size: on-disk cache of DSEIR solutions, see cache.py
+        '''
+        workers = workers or os.cpu_count() or 1
+        # solves and stream reads get threads of their own, a stream blocks one for its whole run
+        # and must never hold up a /dseir request
+        self.solver = ThreadPoolExecutor(thread_name_prefix = 'dseir')
+        self.readers = ThreadPoolExecutor(4 * workers, thread_name_prefix = 'stream')
+        self.batcher = DSEIRBatcher(DSEIRCache(maxsize = 4096, directory = cache_dir, max_bytes = cache_size * 2 ** 20),
+                                    window = window, executor = self.solver)
+        self.pool = ProcessPoolExecutor(workers)
+        self.manager = multiprocessing.Manager()
+
+    async def handle(self, reader, writer):
+        '''Serve the requests of one connection, kept alive until the client closes it'''
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    await self.dispatch(method, path, body, writer)
+                except RequestError as error:
+                    await respond(writer, error.status, {'error': str(error)})
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as error:
+                    await respond(writer, 500, {'error': '{}: {}'.format(type(error).__name__, error)})
+                    break
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body, writer):
+        routes = {'/health': 'GET', '/dseir': 'POST', '/simulate': 'POST'}
+        if path not in routes:
+            raise RequestError(404, 'no such path {}'.format(path))
+        if method != routes[path]:
+            raise RequestError(405, '{} takes {}'.format(path, routes[path]))
+        if path == '/health':
+            return await respond(writer, 200, {'ok': True})
+
+        try:
+            options = json.loads(body or b'{}')
+        except ValueError:
+            raise RequestError(400, 'request body is not valid JSON')
+
+        if path == '/dseir':
+            args = make_args(options, allowed = DSEIR_OPTIONS)
+            try:
+                values = await self.batcher.solve(args)
+            except ValueError as error:
+                raise RequestError(400, str(error))
+            result = {'days': args.TD}
+            result.update(zip(('S', 'E', 'I', 'R', 'D'), values.tolist()))
+            return await respond(writer, 200, result)
+
+        await self.stream(make_args(options, excluded = SIMULATE_EXCLUDED), writer)
+
+    async def stream(self, args, writer):
+        '''Run a simulation in the pool and send each day as a chunk of newline delimited JSON'''
+        loop = asyncio.get_running_loop()
+        queue, cancelled = self.manager.Queue(), self.manager.Event()
+        run = loop.run_in_executor(self.pool, simulate, args, queue, cancelled)
+
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n')
+        try:
+            while True:
+                day = await loop.run_in_executor(self.readers, queue.get)
+                if day is None:
+                    break
+                line = json.dumps(day).encode() + b'\n'
+                writer.write('{:x}\r\n'.format(len(line)).encode() + line + b'\r\n')
+                await writer.drain()
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        except ConnectionError:
+            # the client left, stop the simulation at its next day
+            cancelled.set()
+            raise
+        finally:
+            await run
+
+    async def serve(self, host = '127.0.0.1', port = 8000):
+        # import scipy and warm up the solver before the first request has to wait for it
+        solve_batch([make_args({}, allowed = DSEIR_OPTIONS)])
+        server = await asyncio.start_server(self.handle, host, port)
+        print('Serving on http://{}:{}'.format(host, port))
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown()
+        self.solver.shutdown()
+        self.readers.shutdown()
+        self.manager.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'serve DSEIR solves and headless simulations over HTTP')
+    parser.add_argument('--host', help = 'address to listen on', default = '127.0.0.1')
+    parser.add_argument('--port', help = 'port to listen on', type = int, default = 8000)
+    parser.add_argument('--workers', help = 'simulation processes, defaults to the number of cores', type = int, default = None)
+    parser.add_argument('--batch-window', help = 'milliseconds DSEIR requests wait to be solved together', type = float, default = 2)
+    parser.add_argument('--cache-dir', help = 'directory DSEIR solutions are cached in across restarts', default = None)
+    parser.add_argument('--cache-size', help = 'size in MB the cache directory is trimmed to', type = int, default = 256)
+    options = parser.parse_args()
+
+    service = Service(workers = options.workers, window = options.batch_window / 1000,
+                      cache_dir = options.cache_dir, cache_size = options.cache_size)
+    try:
+        asyncio.run(service.serve(options.host, options.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,125 +1,241 @@
-import math
+import argparse
 
 import numpy as np
-from DSEIR import DSEIR
-from matplotlib import animation
-from matplotlib import pyplot as plt
-from person import Person
-from utils import *
+from cache import solve
+from checkpoint import load_checkpoint, save_checkpoint
+from layouts import build_coordinates
+from population import (COMPARTMENTS, DEAD, EXPOSED, INFECTED, RECOVERED,
+                        SUSCEPTIBLE, Population)
+from profiling import NullProfiler
+from spatial import SpatialIndex
+
+# contact-mode settings a resumed run takes from its checkpoint, see Simulation.resume_settings
+CONTACT_SETTINGS = ('radius', 'prob', 'numb', 'sig', 'gam', 'mu')
+
+
+def draw_exposures(rng, infectors, contacts, number_infectors, numb, prob):
+    '''
+    Contact-driven exposures, see Simulation.update_contacts
+
+    args:
+        rng: np.random.Generator for the draws
+        infectors, contacts: pairs of an infector (position among number_infectors) and a
+                             susceptible person within reach of them
+        numb: most contacts each infector meets
+        prob: probability each contact met is exposed
+    returns:
+        sorted distinct people exposed
+    '''
+    # contacts: shuffle every infector-neighbour pair, then keep the first numb pairs of each infector
+    shuffle = rng.permutation(len(infectors))
+    infectors, contacts = infectors[shuffle], contacts[shuffle]
+    order = np.argsort(infectors, kind = 'stable')
+    infectors, contacts = infectors[order], contacts[order]
+    met = np.bincount(infectors, minlength = number_infectors)
+    rank = np.arange(len(infectors)) - np.repeat(np.cumsum(met) - met, met)
+    contacts = contacts[rank < int(round(numb))]
+    return np.unique(contacts[rng.random(len(contacts)) < prob])
+
+
+def draw_progressions(rng, exposed_people, infected_people, sigma, gamma, mu):
+    '''
+    Per agent progressions, daily rates turned into probabilities
+
+    returns:
+        people becoming infected, dying and recovering
+    '''
+    new_infected = exposed_people[rng.random(len(exposed_people)) < 1 - np.exp(-sigma)]
+    leaving = infected_people[rng.random(len(infected_people)) < 1 - np.exp(-(gamma + mu))]
+    dying = rng.random(len(leaving)) < mu / (gamma + mu)
+    return new_infected, leaving[dying], leaving[~dying]
 
 
 class Simulation():
     '''
     Runs the simulation and handles updating visuals over time. 
+    In headless mode matplotlib is never imported and run_headless() returns the results as arrays.
+    All randomness comes from one np.random.Generator seeded by `seed`, so runs are reproducible.
+    Every simulated day is streamed to `writer` (see output.py) if one is given.
+
+    args.mode picks how agents change compartment: 'curve' (default) forces the agents to follow
+    the DSEIR curve, 'contact' lets infected agents expose their susceptible neighbours within
+    args.radius and draws every other transition per agent, see update_contacts().
+
+    With `resume` the simulation continues from a checkpoint directory (see checkpoint.py),
+    restoring its generator state so the run is bit-identical, unless a `seed` is given to
+    fork a new random branch. With `checkpoint` the full state is saved to that directory
+    every `checkpoint_every` days.
+
+    Stage timings and counters (transitions, neighbour queries, fallback draws) are reported
+    to `profiler`, see profiling.py, and dropped unless one is given.
+
+    With `workers` > 1 a contact-mode day is stepped by that many processes over shared
+    memory, see parallel.py. Parallel runs draw from per-tile streams, so they are
+    reproducible for a seed but differ from serial runs; call close() when done.
     '''
 
-    def __init__(self, args):
-        self.infected_people, self.dead_people, self.exposed_people, self.recovered_people = [], [], [], []
-        self.day = 0
-
-        self.people = self.load_people(number_people = args.TP, 
-                                       number_infected = args.I,
-                                       number_exposed = args.E,
-                                       )
-            
-        self.all_people = [self.people,
-                           self.infected_people,
-                           self.dead_people,
-                           self.recovered_people,
-                           self.exposed_people
-                           ]
-
-        self.DSEIR = DSEIR(args)
-        self.DSEIR_values = list(self.DSEIR.getDSEIR()) # S E I R D, order
+    def __init__(self, args, headless = False, seed = None, writer = None,
+                 resume = None, checkpoint = None, checkpoint_every = 0, profiler = None, workers = 1):
+        self.args = args
+        self.profiler = profiler if profiler is not None else NullProfiler()
+        self.mode = getattr(args, 'mode', None) or 'curve'
+        self.rng = np.random.default_rng(seed)
+        self.writer = writer
+        self.checkpoint, self.checkpoint_every = checkpoint, checkpoint_every
+        self.susceptible_index = None
+        self.stepper = None
+
+        meta = {}
+        if resume is not None:
+            meta, self.population, self.DSEIR_values = load_checkpoint(resume, rng = self.rng)
+            self.day = meta['day']
+            if seed is None:
+                self.rng.bit_generator.state = meta['rng']
+            if meta['args'] is not None:
+                self.resume_settings(meta['args'])
+            if seed is None and (meta.get('parallel') is not None) != (workers > 1):
+                # serial and parallel days draw from different streams, switching would silently fork the run
+                if workers > 1:
+                    raise ValueError('the checkpoint was saved by a serial run, which only continues bit for bit without '
+                                     'workers; pass a seed to fork it in parallel instead')
+                raise ValueError('the checkpoint was saved by a parallel run, which only continues bit for bit with '
+                                 'workers > 1; pass a seed to fork it serially instead')
+            if meta['args'] is not None and args.TD >= len(self.DSEIR_values[0]):
+                # running past the saved curve, solve it again for the longer run with the saved parameters
+                extended = argparse.Namespace(**meta['args'])
+                extended.TD = args.TD
+                self.DSEIR_values = list(solve(extended))
+        else:
+            self.day = 0
+            self.population = self.load_people(number_people = args.TP, 
+                                               number_infected = args.I,
+                                               number_exposed = args.E,
+                                               )
+            self.DSEIR_values = list(solve(args)) # S E I R D, order
         self.DSEIR_values.append([i for i in range(0, len(self.DSEIR_values[0]))])
-        self.plot = self.load_plot(number_people = args.TP)
-
-    def load_plot(self, number_people):
-        # calculate square root
-        root = math.sqrt(number_people)
-
-        self.fig, self.axs = plt.subplots(2, figsize = (10,10))
-        self.axs[0].set_xlim(0, len(self.DSEIR_values[-1]))
-        self.axs[0].set_ylim(0, number_people)
-
-        self.d, = self.axs[1].plot([person.coordinates[0] for person in self.people],
-                               [person.coordinates[1] for person in self.people], 'bo', label = 'susceptible: {}'.format(len(self.people)), markersize = 2)
-        self.i, = self.axs[1].plot([person.coordinates[0] for person in self.infected_people], 
-                               [person.coordinates[1] for person in self.infected_people], 'ro', label = 'infected: {}'.format(len(self.infected_people)), markersize = 2)
-        self.e, = self.axs[1].plot([person.coordinates[0] for person in self.exposed_people],
-                               [person.coordinates[1] for person in self.exposed_people], 'mo', label = 'exposed: {}'.format(len(self.exposed_people)), markersize = 2)
-        self.r, = self.axs[1].plot([person.coordinates[0] for person in self.recovered_people], 
-                               [person.coordinates[1] for person in self.recovered_people], 'go', label = 'recovered: {}'.format(len(self.recovered_people)), markersize = 2)
-        self.p, = self.axs[1].plot([person.coordinates[0] for person in self.dead_people], 
-                               [person.coordinates[1] for person in self.dead_people], 'ko', label = 'dead: {}'.format(len(self.recovered_people)), markersize = 2)
-
-        self.lineS, = self.axs[0].plot((0, 0), 'b')
-        self.lineE, = self.axs[0].plot((0, 0), 'r')
-        self.lineI, = self.axs[0].plot((0, 0), 'm')
-        self.lineR, = self.axs[0].plot((0, 0), 'g')
-        self.lineD, = self.axs[0].plot((0, 0), 'k')
-
-        #self.axs[1].legend(loc = 'upper left')
-        self.axs[0].legend(bbox_to_anchor = (1.1, 1.1))
-        return 
+
+        if workers > 1:
+            if self.mode != 'contact':
+                raise ValueError('parallel steps need --mode contact, curve mode transitions depend on the whole population')
+            from parallel import ParallelStepper
+
+            # a resumed parallel run keeps the streams and strips it was saved with, a fork only the strips
+            saved = meta.get('parallel') or {}
+            if seed is not None:
+                saved = {'edges': saved.get('edges')}
+            entropy = saved.get('entropy', int(self.rng.integers(2 ** 63)))
+            self.stepper = ParallelStepper(self, workers, entropy, edges = saved.get('edges'))
+
+        if resume is None:
+            self.record()
+        if not headless:
+            self.plot = self.load_plot(number_people = len(self.population))
+
+    def resume_settings(self, saved):
+        '''Continue in the checkpoint's mode and with its contact settings, whatever the new command line says'''
+        saved_mode = saved.get('mode') or 'curve'
+        if getattr(self.args, 'mode', None) not in (None, saved_mode):
+            raise ValueError('the checkpoint was saved in {} mode, cannot resume it in {} mode'.format(saved_mode, self.args.mode))
+        self.args = argparse.Namespace(**vars(self.args))
+        for name in CONTACT_SETTINGS:
+            if name in saved:
+                setattr(self.args, name, saved[name])
+        self.args.mode = self.mode = saved_mode
+
+    def load_plot(self, number_people, every = 1):
+        '''Set up the figure, see renderer.py'''
+        from renderer import Renderer
+
+        self.renderer = Renderer(self, every = every)
+        self.fig, self.axs = self.renderer.fig, self.renderer.axs
+        return self.renderer
 
     def load_people(self, number_people, number_infected, number_exposed):
-        '''Create person objects up to number of people. 
+        '''Create the population store, laid out by args.layout (grid unless given, see layouts.py).
 
         args:
-            number_people: the number of people in the simulation
-            step_size: for each step in the simulation, degree of individual movement
+            number_people: the number of people in the simulation, any size
+            number_infected: initial number of infected people
+            number_exposed: initial number of exposed people
 
         returns:
-            list containing people
+            Population holding coordinates and compartment state of everyone
         '''
 
-        root = int(math.sqrt(number_people))
+        print('Number of people in simulation: {}.'.format(number_people))
+        coordinates = build_coordinates(number_people, layout = getattr(self.args, 'layout', 'grid'), rng = self.rng,
+                                        density = getattr(self.args, 'density', None))
+        population = Population(coordinates, rng = self.rng)
 
-        if is_square(number_people):
-            print('Number of people in simulation: {}.'.format(number_people))
-        else:
-            print('Number of people in simulation must be a perfect square. {} is not, try again.'.format(number_people))
-            exit()
-
-        people = []
-        x,y = 1, 1
-        for i in range(root):
-            people.append(Person(x, y))
-            for i in range(root - 1):
-                y += 1
-                people.append(Person(x, y))
-            x += 1
-            y = 1
-
-        # probably want to concatenate this into one loop, kinda unfortunate as is
-        for i in range(0, number_exposed):
-            person = people[np.random.randint(0, number_people)]
-            person.exposed = True
-            people.remove(person)
-            self.exposed_people.append(person)
-
-        for i in range(0, number_infected):
-            person = people[np.random.randint(0, number_people)]
-            person.exposed = True
-            people.remove(person)
-            self.infected_people.append(person)
-
-        return people
+        population.move(population.sample(SUSCEPTIBLE, number_exposed), EXPOSED)
+        population.move(population.sample(SUSCEPTIBLE, number_infected), INFECTED)
+
+        return population
+
+    def move(self, people, compartment):
+        '''Move people to another compartment, keeping the susceptible index current'''
+        self.population.move(people, compartment)
+        self.profiler.count('new_' + COMPARTMENTS[compartment].lower(), np.size(people))
+        if self.susceptible_index is not None:
+            self.susceptible_index.remove(people)
+
+    def get_susceptible_index(self):
+        '''Spatial index over everyone susceptible, rebuilt lazily after each step'''
+        if self.susceptible_index is None:
+            with self.profiler.stage('index_build'):
+                self.susceptible_index = SpatialIndex(self.population.coordinates, self.population.members(SUSCEPTIBLE))
+        return self.susceptible_index
 
     def update(self):
+        '''
+        Apply a full day of transitions, each compartment's new arrivals are
+        sampled and moved as one batch
+        '''
+        if self.mode == 'contact':
+            return self.update_contacts()
+
         try:
-            number_new_exposed     = int(self.DSEIR_values[1][self.day] - len(self.exposed_people))
-            number_new_infected    = int(self.DSEIR_values[2][self.day] - len(self.infected_people))
-            number_new_recovered   = int(self.DSEIR_values[3][self.day] - len(self.recovered_people))
-            number_new_dead        = int(self.DSEIR_values[4][self.day] - len(self.dead_people))
+            number_new_exposed     = int(self.DSEIR_values[1][self.day] - self.population.count(EXPOSED))
+            number_new_infected    = int(self.DSEIR_values[2][self.day] - self.population.count(INFECTED))
+            number_new_recovered   = int(self.DSEIR_values[3][self.day] - self.population.count(RECOVERED))
+            number_new_dead        = int(self.DSEIR_values[4][self.day] - self.population.count(DEAD))
         except:
             return
 
-        self.assign_new_infected(number = number_new_infected)
-        self.assign_new_exposed(number = number_new_exposed)
-        self.assign_new_dead(number = number_new_dead)
-        self.assign_new_recovered(number = number_new_recovered)
+        with self.profiler.stage('assign_new_infected'):
+            self.assign_new_infected(number = number_new_infected)
+        with self.profiler.stage('assign_new_exposed'):
+            self.assign_new_exposed(number = number_new_exposed)
+        with self.profiler.stage('assign_new_dead'):
+            self.assign_new_dead(number = number_new_dead)
+        with self.profiler.stage('assign_new_recovered'):
+            self.assign_new_recovered(number = number_new_recovered)
+
+    def update_contacts(self):
+        '''
+        Contact-driven day. Every infected agent meets at most args.numb random susceptible
+        neighbours within args.radius (manhattan) and exposes each with probability args.prob.
+        Exposed agents become infected with daily rate args.sig, infected agents recover with
+        rate args.gam or die with rate args.mu. All draws are made for the whole population at
+        once from the state at the start of the day, then applied together.
+        '''
+        args = self.args
+        infected_people = self.population.members(INFECTED)
+        exposed_people = self.population.members(EXPOSED)
+
+        index = self.get_susceptible_index()
+        with self.profiler.stage('query_radius'):
+            infectors, contacts = index.query_radius(self.population.coordinates[infected_people], args.radius)
+        self.profiler.count('neighbour_queries', len(infected_people))
+        self.profiler.count('contacts', len(contacts))
+        new_exposed = draw_exposures(self.rng, infectors, contacts, len(infected_people), args.numb, args.prob)
+        new_infected, new_dead, new_recovered = draw_progressions(self.rng, exposed_people, infected_people,
+                                                                  args.sig, args.gam, args.mu)
+
+        self.move(new_exposed, EXPOSED)
+        self.move(new_infected, INFECTED)
+        self.move(new_dead, DEAD)
+        self.move(new_recovered, RECOVERED)
 
     def assign_new_exposed(self, number):
         ''' 
@@ -127,144 +243,175 @@ class Simulation():
         proximity to an infected person
         '''
 
-        for i in range(0, number):
-            try:
-                # this will fail the first few loops, as there is no infected person...sometimes
-                infector = self.infected_people[np.random.randint(0, len(self.infected_people))]
-            except ValueError:
-                print('assign_new_exposed(): no infected person from which to assign exposed, drawing from exposed')
-                #! draw from exposed in that case !?
-                infector = self.exposed_people[np.random.randint(0, len(self.exposed_people))]
-            x_infector, y_infector = infector.coordinates[0], infector.coordinates[1]
-
-            # find the closest healthy person to the infector
-            closest_person_to_infector = self.find_closest_person(infector, type = 'SUSCEPTIBLE')
+        if number <= 0:
+            return
 
-            self.people.remove(closest_person_to_infector)
-            self.exposed_people.append(closest_person_to_infector)
+        source = INFECTED
+        if self.population.count(INFECTED) == 0:
+            # this happens the first few days, as there is no infected person...sometimes
+            #! draw from exposed in that case !?
+            source = EXPOSED
+            self.profiler.count('fallback_exposed_infectors', number)
+        candidates = self.population.members(source)
+        infectors = candidates[self.rng.integers(0, len(candidates), size = number)]
+
+        # batched nearest healthy people for every infector. Each pass every infector takes its closest
+        # candidate not yet claimed, with ties going to the first infector; infectors whose candidates
+        # were all claimed query again with twice as many neighbours
+        index = self.get_susceptible_index()
+        points = self.population.coordinates[infectors]
+        k = 4
+        while len(points) and len(index):
+            candidates = index.query(points, k = min(k, len(index)))
+            self.profiler.count('neighbour_queries', len(points))
+            while len(points):
+                available = index.contains(candidates)
+                rows = np.flatnonzero(available.any(axis = 1))
+                if len(rows) == 0:
+                    break
+                choices = candidates[rows, available[rows].argmax(axis = 1)]
+                _, winners = np.unique(choices, return_index = True)
+                self.move(choices[winners], EXPOSED)
+
+                unresolved = np.ones(len(points), dtype = bool)
+                unresolved[rows[winners]] = False
+                points, candidates = points[unresolved], candidates[unresolved]
+            k *= 2
 
     def assign_new_dead(self, number):
-        for i in range(0, number):
-            new_dead_person = self.infected_people[np.random.randint(0, len(self.infected_people))]
-
-            self.infected_people.remove(new_dead_person)
-            self.dead_people.append(new_dead_person)
+        self.move(self.population.sample(INFECTED, number), DEAD)
 
     def assign_new_recovered(self, number):
-        for i in range(0, number):
-            recoveree = self.infected_people[np.random.randint(0, len(self.infected_people))]
-
-            self.infected_people.remove(recoveree)
-            self.recovered_people.append(recoveree)
+        self.move(self.population.sample(INFECTED, number), RECOVERED)
 
     def assign_new_infected(self, number):
-        for i in range(0, number):
-            # select new infected person from those who have been exposed
-            try:
-                # at the end of the simulation, sometimes a person becomes infected while there are 0 exposed
-                # assign it from healthy if this happens
-                new_infected_person = self.exposed_people[np.random.randint(0, len(self.exposed_people))]
-                self.exposed_people.remove(new_infected_person)
-                self.infected_people.append(new_infected_person)
-            except ValueError:
-                print('assign_new_infected(): no exposed people from which to assign infection, drawing from healthy ')
-                new_infected_person = self.people[np.random.randint(0, len(self.people))]
-                self.people.remove(new_infected_person)
-                self.infected_people.append(new_infected_person)
+        # select new infected people from those who have been exposed
+        new_infected_people = self.population.sample(EXPOSED, number)
+        if len(new_infected_people) < number:
+            # at the end of the simulation, sometimes people become infected while there are too few exposed
+            # assign the rest from healthy if this happens
+            self.profiler.count('fallback_infected_from_susceptible', number - len(new_infected_people))
+            new_infected_people = np.concatenate((new_infected_people,
+                                                  self.population.sample(SUSCEPTIBLE, number - len(new_infected_people))))
+        self.move(new_infected_people, INFECTED)
 
     def find_closest_person(self, POI, type = None):
         '''
         find the closest person of a specific type to another person
 
         args:
-            POI: the person we want to find another close to
+            POI: index of the person we want to find another close to
             type: can be SUSCEPTIBLE, EXPOSED, INFECTED, RECOVERED, DEAD,
 
         returns:
-            person object of closest person
+            index of closest person, None if nobody of that type is left
         '''
 
-        if type is not None:
-            # i think that checking for specific type and choosing list
-            # will be faster than iterating through all people and checking type, for people > 10000ish
-            if type == 'SUSCEPTIBLE':
-                people_of_interest = self.people
-            elif type == 'INFECTED':
-                people_of_interest = self.infected_people
-            elif type == 'EXPOSED':
-                people_of_interest = self.exposed_people
-            elif type == 'DEAD':
-                people_of_interest = self.dead_people
-            elif type == 'RECOVERED':
-                people_of_interest = self.recovered_people
+        if type is None:
+            print('Error in find_closest_person: query requested without specifying type')
+            return None
+        if type not in COMPARTMENTS:
+            print('Error in find_closest_person: query type INVALID')
+            return None
+
+        if type == 'SUSCEPTIBLE':
+            return self.get_susceptible_index().nearest(self.population.coordinates[POI])
+
+        people_of_interest = self.population.members(COMPARTMENTS.index(type))
+        if len(people_of_interest) == 0:
+            return None
+
+        # manhattan distance from the POI to everyone of the requested type
+        distances = np.abs(self.population.coordinates[people_of_interest] - self.population.coordinates[POI]).sum(axis = 1)
+        return people_of_interest[np.argmin(distances)]
+
+    def step(self):
+        '''Advance the simulation by one day'''
+        profiler = self.profiler
+        with profiler.stage('step'):
+            if self.stepper is not None:
+                self.susceptible_index = None
+                self.day += 1
+                with profiler.stage('parallel_step'):
+                    self.stepper.step(self.day)
             else:
-                print('Error in find_closest_person: query type INVALID')
+                with profiler.stage('take_step'):
+                    self.population.take_step()
+                self.susceptible_index = None
+
+                self.day += 1
+                with profiler.stage('update'):
+                    self.update()
+            with profiler.stage('record'):
+                self.record()
+            if self.checkpoint is not None and self.checkpoint_every and self.day % self.checkpoint_every == 0:
+                with profiler.stage('checkpoint'):
+                    self.save_checkpoint(self.checkpoint)
+        profiler.end_day(self.day)
+
+    def close(self):
+        '''Stop the parallel workers, if any'''
+        if self.stepper is not None:
+            self.stepper.close()
+            self.stepper = None
+
+    def save_checkpoint(self, path):
+        '''Save the full state of the simulation to the directory `path`'''
+        save_checkpoint(self, path, args = self.args)
+
+    def record(self):
+        '''Stream the current day to the results writer, if any'''
+        if self.writer is None:
+            return
+        if self.day < len(self.DSEIR_values[-1]):
+            model_counts = [values[self.day] for values in self.DSEIR_values[:5]]
         else:
-            print('Error in find_closest_person: query requested without specifying type')
-
-        x_POI, y_POI = POI.coordinates[0], POI.coordinates[1]
-        # probably a better way to do this, but l0l
-        x_dif_init, y_dif_init = 10000, 10000
-        chosen_person = None
-
-        for i in range(0, len(people_of_interest)):
-            x, y = people_of_interest[i].coordinates[0], people_of_interest[i].coordinates[1]
-            x_dif, y_dif = abs(x_POI - x), abs(y_POI - y)   
-            if (x_dif + y_dif) < (x_dif_init + y_dif_init):
-                x_dif_init, y_dif_init = x_dif, y_dif
-                chosen_person = people_of_interest[i]
-
-        return chosen_person
+            model_counts = [np.nan] * 5
+        self.writer.write_day(self.day, model_counts, self.population.counts(),
+                              coordinates = self.population.coordinates, state = self.population.state)
 
     def animate(self, b):
         ''' 
         Create the animation. Function is CALLED by self.run()
-        every step of the simulation, updating dot placement and infected
+        every frame of the simulation, updating dot placement and infected
         status. 
         '''
-        for person_type in self.all_people:
-            for person in person_type:
-                person.take_step()
-
-        self.day += 1
-        self.update()
-
-        # update dots
-        self.d.set_data([person.coordinates[0] for person in self.people],
-                        [person.coordinates[1] for person in self.people])   
-
-        self.i.set_data([person.coordinates[0] for person in self.infected_people],
-                        [person.coordinates[1] for person in self.infected_people])
-
-        self.e.set_data([person.coordinates[0] for person in self.exposed_people],
-                        [person.coordinates[1] for person in self.exposed_people]) 
-
-        self.r.set_data([person.coordinates[0] for person in self.recovered_people],
-                        [person.coordinates[1] for person in self.recovered_people]) 
-
-        self.p.set_data([person.coordinates[0] for person in self.dead_people],
-                        [person.coordinates[1] for person in self.dead_people]) 
-
-        # update lines
-        self.lineS.set_data(self.DSEIR_values[-1][0:self.day], self.DSEIR_values[0][0:self.day])
-        self.lineE.set_data(self.DSEIR_values[-1][0:self.day], self.DSEIR_values[1][0:self.day])
-        self.lineI.set_data(self.DSEIR_values[-1][0:self.day], self.DSEIR_values[2][0:self.day])
-        self.lineR.set_data(self.DSEIR_values[-1][0:self.day], self.DSEIR_values[3][0:self.day])
-        self.lineD.set_data(self.DSEIR_values[-1][0:self.day], self.DSEIR_values[4][0:self.day])
-
-        self.axs[0].legend(['healthy: {}'.format(len(self.people)), 
-                             'infected: {}'.format(len(self.infected_people)),
-                             'exposed: {}'.format(len(self.exposed_people)),
-                             'recovered: {}'.format(len(self.recovered_people)),
-                             'dead: {}'.format(len(self.dead_people))],
-                            #'day: {}'.format(self.day)], 
-                            #bbox_to_anchor = (1, 1),
-                             loc = 'upper left')
-
-        return self.d, self.i, #legend
-
-    def run(self, number_days = 5):
-        anim = animation.FuncAnimation(self.fig, self.animate, interval = 50)
-        #plt.show()
-        anim.save('test.gif', writer = 'imagemagick', fps = 5)
-        
\ No newline at end of file
+        return self.renderer.draw_frame(b)
+
+    def run(self, number_days = 5, path = 'test.gif', writer = None, every = 1, fps = 5):
+        '''
+        Render the simulation to a file, see Renderer.save
+
+        args:
+            number_days: days to simulate
+            path: output file, or directory when dumping frames
+            writer: pillow, ffmpeg, imagemagick or frames, picked from path if not given
+            every: draw every this many days
+            fps: frames per second of the encoded file
+        '''
+        self.renderer.every = every
+        self.renderer.save(path, number_days, writer = writer, fps = fps)
+
+    def run_headless(self, number_days, positions = False):
+        '''
+        Advance the day loop directly, without any plotting
+
+        args:
+            number_days: number of days to simulate
+            positions: also record everyone's coordinates each day
+        returns:
+            (number_days + 1, 5) array of compartment counts per day in S E I R D order,
+            starting with the current day, and a (number_days + 1, N, 2) array of
+            coordinates per day, None unless positions was requested
+        '''
+        counts = np.empty((number_days + 1, len(COMPARTMENTS)), dtype = np.int64)
+        coordinates = np.empty((number_days + 1, len(self.population), 2)) if positions else None
+
+        for day in range(number_days + 1):
+            if day > 0:
+                self.step()
+            counts[day] = self.population.counts()
+            if positions:
+                coordinates[day] = self.population.coordinates
+
+        return counts, coordinates
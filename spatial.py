@@ -0,0 +1,122 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class SpatialIndex():
+    '''
+    KD-tree over a fixed set of people used for nearest neighbour queries.
+    Distances are manhattan, matching Simulation.find_closest_person. People can be
+    removed (e.g. once they stop being susceptible) but not added; build a new index
+    after everyone has moved.
+    '''
+
+    def __init__(self, coordinates, members):
+        '''
+        args:
+            coordinates: (N, 2) coordinates of the whole population
+            members: indices of the people to index
+        '''
+        self.slot = np.full(len(coordinates), -1, dtype = np.int64)
+        self.build(np.asarray(members, dtype = np.int64), coordinates[members])
+
+    def build(self, ids, points):
+        self.ids, self.points = ids, points
+        self.tree = cKDTree(points, balanced_tree = False, compact_nodes = False)
+        self.alive = np.ones(len(ids), dtype = bool)
+        self.size = len(ids)
+
+        # slot of every person of the population inside self.ids, -1 if not indexed
+        self.slot[ids] = np.arange(len(ids))
+
+    def compact(self):
+        '''Rebuild the tree without the removed people'''
+        self.slot[self.ids[~self.alive]] = -1
+        self.build(self.ids[self.alive], self.points[self.alive])
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, person):
+        slot = self.slot[person]
+        return slot >= 0 and self.alive[slot]
+
+    def contains(self, people):
+        '''Vectorized membership test, -1 entries (query padding) are never members'''
+        people = np.asarray(people)
+        slots = np.where(people >= 0, self.slot[np.maximum(people, 0)], -1)
+        return (slots >= 0) & self.alive[np.maximum(slots, 0)]
+
+    def remove(self, people):
+        '''Drop one index or an array of indices, anyone not in the index is ignored'''
+        slots = np.atleast_1d(self.slot[people])
+        slots = slots[slots >= 0]
+        self.size -= int(np.count_nonzero(self.alive[slots]))
+        self.alive[slots] = False
+
+    def nearest(self, point):
+        '''
+        returns:
+            index of the closest indexed person to point, None if the index is empty
+        '''
+        neighbours = self.query(np.asarray(point, dtype = np.float64).reshape(1, 2), k = 1)[0, 0]
+        return None if neighbours < 0 else neighbours
+
+    def query(self, points, k = 1):
+        '''
+        k nearest indexed people for many points at once.
+
+        args:
+            points: (M, 2) query coordinates
+            k: number of neighbours per query
+        returns:
+            (M, k) array of person indices sorted by distance, padded with -1 when
+            fewer than k people are left in the index
+        '''
+        points = np.asarray(points, dtype = np.float64).reshape(-1, 2)
+        result = np.full((len(points), k), -1, dtype = np.int64)
+        if self.size == 0 or len(points) == 0:
+            return result
+
+        # the tree still holds removed people, so ask for extra neighbours and skip the removed
+        # ones, asking again with twice as many for the rows that came up short. Once the removed
+        # people crowd out the live ones the tree is rebuilt without them
+        pending = np.arange(len(points))
+        wanted = min(2 * k, len(self.ids))
+        while len(pending):
+            if wanted > 8 * k and self.size < len(self.ids):
+                self.compact()
+                wanted = min(2 * k, len(self.ids))
+            _, slots = self.tree.query(points[pending], k = wanted, p = 1)
+            slots = slots.reshape(len(pending), wanted)
+            live = self.alive[np.minimum(slots, len(self.ids) - 1)] & (slots < len(self.ids))
+            found = live.sum(axis = 1)
+            done = (found >= min(k, self.size)) | (wanted == len(self.ids))
+
+            live, slots = live[done], slots[done]
+            rows, columns = np.nonzero(live)
+            rank = np.cumsum(live, axis = 1)[rows, columns] - 1
+            keep = rank < k
+            result[pending[done][rows[keep]], rank[keep]] = self.ids[slots[rows[keep], columns[keep]]]
+
+            pending = pending[~done]
+            wanted = min(2 * wanted, len(self.ids))
+        return result
+
+    def query_radius(self, points, radius):
+        '''
+        Everyone indexed within `radius` of many points at once.
+
+        args:
+            points: (M, 2) query coordinates
+            radius: manhattan distance
+        returns:
+            (query, person) arrays pairing the position of a point in points with
+            each indexed person in range of it
+        '''
+        points = np.asarray(points, dtype = np.float64).reshape(-1, 2)
+        if self.size == 0 or len(points) == 0:
+            return np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int64)
+
+        pairs = cKDTree(points).sparse_distance_matrix(self.tree, radius, p = 1, output_type = 'ndarray')
+        live = self.alive[pairs['j']]
+        return pairs['i'][live], self.ids[pairs['j'][live]]